@@ -0,0 +1,199 @@
+"""
+واجهة JSON خفيفة لمنصة المهام (بدون Streamlit) تعمل بجانب التطبيق على قاعدة البيانات نفسها
+تشغيل: python api.py --port 8502
+
+المصادقة: Authorization: Bearer <token>  (إنشاء رمز: python manage.py token <username>)
+
+GET  /api/tasks                 مهام المستخدم المستحقة اليوم (?user=<uid> للآدمن)
+GET  /api/stats                 إحصاءات اليوم للمستخدم (?user=<uid> للآدمن)
+GET  /api/leaderboard           لوحة الشرف لليوم
+POST /api/completions           {"items": [{"task": "<uid>", "units": 5, "user": "<uid>"}, ...]}
+                                "units" للمهام الكمية فقط، و"user" متاح للآدمن فقط (محطات المسح)
+"""
+
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import db
+
+MAX_BATCH = 500
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _public_user(u):
+    return {"id": u["uid"], "username": u["username"], "name": u["name"], "role": u["role"]}
+
+
+def _public_task(t):
+    return {
+        "id": t["uid"], "title": t["title"], "task_type": t["task_type"], "points": t["points"],
+        "unit": t["unit"], "points_per_unit": t["points_per_unit"], "target_units": t["target_units"],
+    }
+
+
+def _target_user(caller, user_uid):
+    """سجل المستخدم المقصود بالطلب: المستدعي نفسه، أو أي مستخدم إن كان آدمن"""
+    if not user_uid or user_uid == caller["uid"]:
+        return caller
+    if caller["role"] != "admin":
+        raise ApiError(403, "only admin tokens may act for other users")
+    user = db.get_user_by_uid(user_uid)
+    if user is None:
+        raise ApiError(404, f"unknown user {user_uid}")
+    return user
+
+
+# ─────────────────────────────────────────────
+# المسارات
+# ─────────────────────────────────────────────
+def get_tasks(caller, query, body):
+    user = _target_user(caller, query.get("user"))
+    return {"day": db.day_iso(db.today()), "tasks": [_public_task(t) for t in db.get_tasks(user["id"])]}
+
+
+def get_stats(caller, query, body):
+    user = _target_user(caller, query.get("user"))
+    pts, done, total, pct, _ = db.compute_user_stats(user["id"], db.get_tasks(user["id"]))
+    return {"day": db.day_iso(db.today()), "points": pts, "done": done, "total": total, "pct": pct}
+
+
+def get_leaderboard(caller, query, body):
+    groups = {g["id"]: g["name"] for g in db.get_groups()}
+    return {"day": db.day_iso(db.today()), "leaderboard": [
+        {**_public_user(r), "group": groups.get(r["group_id"]), "points": r["pts"], "pct": r["pct"]}
+        for r in db.get_leaderboard()
+    ]}
+
+
+def post_completions(caller, query, body):
+    items = body.get("items") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, "body must be {\"items\": [...]}")
+    if len(items) > MAX_BATCH:
+        raise ApiError(413, f"at most {MAX_BATCH} items per request")
+    if not all(isinstance(it, dict) and isinstance(it.get("task"), str) for it in items):
+        raise ApiError(400, "each item needs a \"task\" id")
+    if not all(it.get("user") is None or isinstance(it["user"], str) for it in items):
+        raise ApiError(400, "\"user\" must be a user id string")
+
+    task_ids = db.get_ids_by_uid("tasks", [it["task"] for it in items])
+    user_uids = [it["user"] for it in items if it.get("user") and it["user"] != caller["uid"]]
+    if user_uids and caller["role"] != "admin":
+        raise ApiError(403, "only admin tokens may act for other users")
+    user_ids = db.get_ids_by_uid("users", user_uids) | {caller["uid"]: caller["id"]}
+
+    resolved, results = [], [None] * len(items)
+    for i, it in enumerate(items):
+        uid = user_ids.get(it.get("user") or caller["uid"])
+        tid = task_ids.get(it["task"])
+        if uid is None or tid is None:
+            results[i] = {"status": "error", "error": "unknown user or task"}
+        else:
+            resolved.append((i, {"user_id": uid, "task_id": tid, "units": it.get("units")}))
+    for (i, _), res in zip(resolved, db.submit_completions([r for _, r in resolved])):
+        results[i] = res
+    for it, res in zip(items, results):
+        res["task"] = it["task"]
+    return {"ok": sum(r["status"] != "error" for r in results), "results": results}
+
+
+ROUTES = {
+    ("GET", "/api/tasks"): get_tasks,
+    ("GET", "/api/stats"): get_stats,
+    ("GET", "/api/leaderboard"): get_leaderboard,
+    ("POST", "/api/completions"): post_completions,
+}
+
+
+# ─────────────────────────────────────────────
+# الخادم
+# ─────────────────────────────────────────────
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: اتصال واحد لعدة طلبات
+    disable_nagle_algorithm = True  # الترويسة والجسم يُرسلان في كتابتين؛ بدون هذا ينتظر كل رد ~40ms
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        try:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # لا يُعرف أين ينتهي الجسم فلا يصلح الاتصال لطلب تالٍ
+                self.close_connection = True
+                raise ApiError(400, "invalid Content-Length")
+            raw = self.rfile.read(length) if length else b""
+            route = ROUTES.get((method, url.path))
+            if route is None:
+                raise ApiError(404, "not found")
+            auth = self.headers.get("Authorization", "")
+            caller = db.get_token_user(auth[7:]) if auth.startswith("Bearer ") else None
+            if caller is None:
+                raise ApiError(401, "missing or invalid token")
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                raise ApiError(400, "invalid JSON")
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            self._send(200, route(caller, query, body))
+        except ApiError as e:
+            self._send(e.status, {"error": str(e)})
+        except Exception:
+            self._send(500, {"error": "internal error"})
+            raise
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8502, verbose=False):
+    db.init_db()
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Task tracker JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", default=db.DB, help="path to the main database file")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    db.DB = args.db
+    server = make_server(args.host, args.port, args.verbose)
+    print(f"serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
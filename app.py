@@ -5,14 +5,23 @@ Task Tracker - Python + Streamlit + SQLite + Plotly
 """
 
 import streamlit as st
-import sqlite3
-import hashlib
-import uuid
-from datetime import date, timedelta
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
-from contextlib import contextmanager
+import numpy as np
+import itertools
+from datetime import date
+
+from db import (
+    init_db, today, to_day, day_iso, last_7_days,
+    get_user, get_all_users, add_user, delete_user, update_user_group,
+    create_session, get_session_user, end_session,
+    get_groups, add_group, delete_group,
+    get_tasks, add_task, update_task_schedule, delete_task, is_due,
+    get_completions, get_daily_points, complete_check, undo_task, complete_numeric,
+    compute_user_stats, get_user_stats, get_leaderboard, search, archive_completions, ARCHIVE_AFTER_DAYS,
+    get_activity, get_data_version,
+)
 
 # ─────────────────────────────────────────────
 # إعداد الصفحة
@@ -261,184 +270,6 @@ def style_chart(fig):
     )
     return fig
 
-# ─────────────────────────────────────────────
-# قاعدة البيانات
-# ─────────────────────────────────────────────
-DB = "tasks.db"
-
-@contextmanager
-def get_db():
-    conn = sqlite3.connect(DB, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
-
-def init_db():
-    with get_db() as conn:
-        conn.executescript("""
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            name TEXT NOT NULL,
-            role TEXT DEFAULT 'user',
-            group_id TEXT
-        );
-        CREATE TABLE IF NOT EXISTS groups_ (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL
-        );
-        CREATE TABLE IF NOT EXISTS tasks (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            assigned_to TEXT NOT NULL,
-            task_type TEXT DEFAULT 'check',
-            points INTEGER DEFAULT 10,
-            unit TEXT DEFAULT '',
-            points_per_unit REAL DEFAULT 1.0,
-            target_units REAL DEFAULT 1.0,
-            created_at TEXT
-        );
-        CREATE TABLE IF NOT EXISTS completions (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            task_id TEXT NOT NULL,
-            date_ TEXT NOT NULL,
-            units REAL DEFAULT 1.0,
-            points REAL DEFAULT 0.0,
-            UNIQUE(user_id, task_id, date_)
-        );
-        """)
-        exists = conn.execute("SELECT id FROM users WHERE username='admin'").fetchone()
-        if not exists:
-            conn.execute(
-                "INSERT INTO users (id, username, password_hash, name, role) VALUES (?,?,?,?,?)",
-                (str(uuid.uuid4()), "admin", hash_pw("admin123"), "المدير", "admin")
-            )
-
-def hash_pw(pw): return hashlib.sha256(pw.encode()).hexdigest()
-def today(): return date.today().isoformat()
-def gen_id(): return str(uuid.uuid4())[:8]
-def last_7_days():
-    return [(date.today() - timedelta(days=i)).isoformat() for i in range(6, -1, -1)]
-
-# ─────────────────────────────────────────────
-# دوال قاعدة البيانات
-# ─────────────────────────────────────────────
-def get_user(username, password):
-    with get_db() as conn:
-        row = conn.execute(
-            "SELECT * FROM users WHERE username=? AND password_hash=?",
-            (username, hash_pw(password))
-        ).fetchone()
-        return dict(row) if row else None
-
-def get_all_users():
-    with get_db() as conn:
-        return [dict(r) for r in conn.execute("SELECT * FROM users WHERE role != 'admin'").fetchall()]
-
-def add_user(name, username, password, group_id=None):
-    with get_db() as conn:
-        try:
-            conn.execute(
-                "INSERT INTO users (id,username,password_hash,name,role,group_id) VALUES (?,?,?,?,?,?)",
-                (gen_id(), username, hash_pw(password), name, "user", group_id or None)
-            )
-            return True
-        except sqlite3.IntegrityError:
-            return False
-
-def delete_user(uid):
-    with get_db() as conn:
-        conn.execute("DELETE FROM users WHERE id=?", (uid,))
-        conn.execute("DELETE FROM completions WHERE user_id=?", (uid,))
-
-def update_user_group(uid, group_id):
-    with get_db() as conn:
-        conn.execute("UPDATE users SET group_id=? WHERE id=?", (group_id or None, uid))
-
-def get_groups():
-    with get_db() as conn:
-        return [dict(r) for r in conn.execute("SELECT * FROM groups_").fetchall()]
-
-def add_group(name):
-    with get_db() as conn:
-        conn.execute("INSERT INTO groups_ (id,name) VALUES (?,?)", (gen_id(), name))
-
-def delete_group(gid):
-    with get_db() as conn:
-        conn.execute("DELETE FROM groups_ WHERE id=?", (gid,))
-        conn.execute("UPDATE users SET group_id=NULL WHERE group_id=?", (gid,))
-
-def get_tasks(user_id=None):
-    with get_db() as conn:
-        if user_id:
-            rows = conn.execute(
-                "SELECT * FROM tasks WHERE assigned_to='all' OR assigned_to=?", (user_id,)
-            ).fetchall()
-        else:
-            rows = conn.execute("SELECT * FROM tasks").fetchall()
-        return [dict(r) for r in rows]
-
-def add_task(title, assigned_to, task_type, points, unit, points_per_unit, target_units):
-    with get_db() as conn:
-        conn.execute(
-            "INSERT INTO tasks (id,title,assigned_to,task_type,points,unit,points_per_unit,target_units,created_at) VALUES (?,?,?,?,?,?,?,?,?)",
-            (gen_id(), title, assigned_to, task_type, points, unit, points_per_unit, target_units, today())
-        )
-
-def delete_task(tid):
-    with get_db() as conn:
-        conn.execute("DELETE FROM tasks WHERE id=?", (tid,))
-        conn.execute("DELETE FROM completions WHERE task_id=?", (tid,))
-
-def get_completions(user_id=None, date_=None):
-    with get_db() as conn:
-        q, params = "SELECT * FROM completions WHERE 1=1", []
-        if user_id: q += " AND user_id=?"; params.append(user_id)
-        if date_:   q += " AND date_=?";   params.append(date_)
-        return [dict(r) for r in conn.execute(q, params).fetchall()]
-
-def complete_check(user_id, task_id, points):
-    with get_db() as conn:
-        try:
-            conn.execute(
-                "INSERT INTO completions (id,user_id,task_id,date_,units,points) VALUES (?,?,?,?,?,?)",
-                (gen_id(), user_id, task_id, today(), 1, points)
-            )
-        except sqlite3.IntegrityError:
-            pass
-
-def undo_task(user_id, task_id):
-    with get_db() as conn:
-        conn.execute(
-            "DELETE FROM completions WHERE user_id=? AND task_id=? AND date_=?",
-            (user_id, task_id, today())
-        )
-
-def complete_numeric(user_id, task_id, units, pts):
-    with get_db() as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO completions (id,user_id,task_id,date_,units,points) VALUES (?,?,?,?,?,?)",
-            (gen_id(), user_id, task_id, today(), units, pts)
-        )
-
-def compute_user_stats(uid, tasks_all):
-    comps = get_completions(uid, today())
-    comp_map = {c["task_id"]: c for c in comps}
-    user_tasks = [t for t in tasks_all if t["assigned_to"] == "all" or t["assigned_to"] == uid]
-    done = sum(1 for t in user_tasks if t["id"] in comp_map)
-    pts = sum(c["points"] for c in comps)
-    max_pts = sum(
-        t["points"] if t["task_type"] == "check" else t["points_per_unit"] * t["target_units"]
-        for t in user_tasks
-    )
-    pct = int(pts / max_pts * 100) if max_pts > 0 else 0
-    return pts, done, len(user_tasks), pct, comp_map
-
 # ─────────────────────────────────────────────
 # مكونات مشتركة
 # ─────────────────────────────────────────────
@@ -462,10 +293,68 @@ def header_bar(user):
         theme_toggle_btn()
     with c3:
         if st.button("🚪 خروج", key="logout_btn"):
-            st.session_state.user = None
+            end_session(st.session_state.token)
+            st.session_state.token = None
             st.rerun()
     st.markdown("<hr>", unsafe_allow_html=True)
 
+RECUR_OPTS = {"يومية": "daily", "أيام محددة من الأسبوع": "weekly", "كل عدة أيام": "interval", "مرة واحدة": "once"}
+RECUR_OPTS_BY_VALUE = {v: k for k, v in RECUR_OPTS.items()}
+WEEKDAYS = {"الاثنين": 0, "الثلاثاء": 1, "الأربعاء": 2, "الخميس": 3, "الجمعة": 4, "السبت": 5, "الأحد": 6}
+
+def recur_label(task):
+    recur = task.get("recur") or "daily"
+    if recur == "weekly":
+        label = "، ".join(n for n, i in WEEKDAYS.items() if task["weekdays"] & (1 << i))
+    elif recur == "interval":
+        label = f'كل {task["interval_days"]} أيام'
+    elif recur == "once":
+        return f'مرة واحدة: {day_iso(task["start_day"])}'
+    else:
+        label = "يومية"
+    if task.get("end_day"):
+        label += f' حتى {day_iso(task["end_day"])}'
+    return label
+
+def recur_select(key, task=None):
+    """
+    نوع التكرار يُختار خارج النموذج: حقول النموذج لا تُعيد تشغيل الصفحة قبل الإرسال،
+    فلو كان داخله لما ظهرت أيام الأسبوع أو عدد الأيام إلا بعد حفظ المهمة.
+    """
+    current = RECUR_OPTS_BY_VALUE[(task or {}).get("recur") or "daily"]
+    return RECUR_OPTS[st.selectbox("التكرار", list(RECUR_OPTS), index=list(RECUR_OPTS).index(current),
+                                   key=f"{key}_recur")]
+
+def schedule_inputs(key, recur, task=None):
+    """بقية حقول قاعدة التكرار داخل النموذج؛ تُرجع معاملات add_task / update_task_schedule"""
+    start = task["start_day"] if task and task["start_day"] else today()
+    end = task["end_day"] if task else None
+    c1, c2 = st.columns(2)
+    start = c1.date_input("تبدأ من", value=date.fromordinal(start), key=f"{key}_start")
+    end   = c2.date_input("تنتهي في (اختياري)", value=date.fromordinal(end) if end else None, key=f"{key}_end")
+    days, interval = list(WEEKDAYS), 1
+    if recur == "weekly":
+        default = ([n for n, i in WEEKDAYS.items() if task["weekdays"] & (1 << i)]
+                   if task and task["recur"] == "weekly" else list(WEEKDAYS)[:5])
+        days = st.multiselect("أيام الأسبوع", list(WEEKDAYS), default=default, key=f"{key}_days")
+    elif recur == "interval":
+        interval = st.number_input("كل كم يوم؟", min_value=2, value=max((task or {}).get("interval_days") or 2, 2),
+                                   key=f"{key}_interval")
+    return {
+        "recur": recur,
+        "weekdays": sum(1 << WEEKDAYS[d] for d in days),
+        "interval_days": int(interval),
+        "start_day": to_day(start),
+        "end_day": to_day(end) if end else None,
+    }
+
+def schedule_error(sched):
+    if sched["recur"] == "weekly" and not sched["weekdays"]:
+        return "اختر يوماً واحداً على الأقل من أيام الأسبوع"
+    if sched["end_day"] is not None and sched["end_day"] < sched["start_day"]:
+        return "تاريخ الانتهاء قبل تاريخ البداية"
+    return None
+
 def progress_html(pct):
     t = T()
     return (
@@ -531,7 +420,7 @@ def login_page():
         if submitted:
             user = get_user(username, password)
             if user:
-                st.session_state.user = user
+                st.session_state.token = create_session(user["id"])
                 st.rerun()
             else:
                 st.error("❌ اسم المستخدم أو كلمة المرور غير صحيحة")
@@ -552,6 +441,7 @@ def user_dashboard(user):
     t = T()
     header_bar(user)
 
+    # get_tasks تقرأ مجموعة المستخدم من القاعدة، لا من سجل الجلسة المخزّن
     tasks_all = get_tasks(user["id"])
     pts, done, total, pct, comp_map = compute_user_stats(user["id"], tasks_all)
 
@@ -563,14 +453,19 @@ def user_dashboard(user):
         c2.metric("✅ منجز", f"{done}/{total}")
         c3.metric("📈 الإنجاز", f"{pct}%")
         st.progress(pct / 100)
+
+        life = get_user_stats(user["id"])
+        c4, c5, c6, c7 = st.columns(4)
+        c4.metric("🔥 السلسلة الحالية", f'{life["current_streak"]} يوم')
+        c5.metric("🏅 أطول سلسلة", f'{life["longest_streak"]} يوم')
+        c6.metric("💯 مجموع نقاطي", int(life["lifetime_points"]))
+        c7.metric("📅 أفضل يوم", int(life["best_day_points"]),
+                  help=day_iso(life["best_day"]) if life["best_day"] else None)
         st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
 
         # رسم شخصي
-        days = last_7_days()
-        df_p = pd.DataFrame([
-            {"اليوم": d, "النقاط": sum(c["points"] for c in get_completions(user["id"], d))}
-            for d in days
-        ])
+        daily = get_daily_points(last_7_days(), user["id"])
+        df_p = pd.DataFrame([{"اليوم": day_iso(d), "النقاط": p} for d, p in daily.items()])
         fig_p = go.Figure(go.Scatter(
             x=df_p["اليوم"], y=df_p["النقاط"],
             mode="lines+markers",
@@ -597,18 +492,11 @@ def user_dashboard(user):
 
         # لوحة الشرف
         st.markdown('<h3>🏆 لوحة الشرف – اليوم</h3>', unsafe_allow_html=True)
-        all_tasks = get_tasks()
-        all_users = get_all_users()
-        lb = sorted([
-            {**u,
-             "pts": sum(c["points"] for c in get_completions(u["id"], today())),
-             "pct": compute_user_stats(u["id"], all_tasks)[3]}
-            for u in all_users
-        ], key=lambda x: x["pts"], reverse=True)
+        lb = get_leaderboard()
         st.markdown(leaderboard_html(lb, groups, highlight_uid=user["id"]), unsafe_allow_html=True)
 
     with tab_tasks:
-        st.markdown(f'<p style="color:{t["muted"]};margin-bottom:12px">اليوم: {today()}</p>', unsafe_allow_html=True)
+        st.markdown(f'<p style="color:{t["muted"]};margin-bottom:12px">اليوم: {day_iso(today())}</p>', unsafe_allow_html=True)
 
         if not tasks_all:
             st.info("لا توجد مهام مُعيَّنة لك اليوم.")
@@ -625,7 +513,8 @@ def user_dashboard(user):
         for task in tasks_all:
             done_comp = comp_map.get(task["id"])
             is_done   = done_comp is not None
-            all_badge = '<span class="badge badge-purple">للجميع</span>' if task["assigned_to"] == "all" else ""
+            all_badge = ('<span class="badge badge-purple">لمجموعتي</span>' if task["group_id"] is not None
+                         else '<span class="badge badge-purple">للجميع</span>' if task["assigned_to"] is None else "")
 
             if task["task_type"] == "check":
                 pts_badge  = f'<span class="badge badge-gold">⭐ {task["points"]} نقطة</span>'
@@ -675,18 +564,198 @@ def user_dashboard(user):
 # ─────────────────────────────────────────────
 # لوحة الآدمن
 # ─────────────────────────────────────────────
+SEARCH_KINDS = {"task": ("📋 مهمة", "badge-blue"), "user": ("👤 مستخدم", "badge-green"), "group": ("👥 مجموعة", "badge-purple")}
+
+def admin_search():
+    t = T()
+    q = st.text_input("🔎 بحث", placeholder="ابحث في المهام والمستخدمين والمجموعات...", label_visibility="collapsed")
+    if not q.strip():
+        return
+    results = search(q)
+    if not results:
+        st.markdown(f'<p style="color:{t["muted"]}">لا توجد نتائج.</p>', unsafe_allow_html=True)
+        return
+    html = ""
+    for r in results:
+        label, cls = SEARCH_KINDS[r["kind"]]
+        detail = f' <span style="color:{t["muted"]};font-size:13px">{r["detail"]}</span>' if r["detail"] else ""
+        html += (
+            f'<div style="background:{t["surface"]};border:1px solid {t["border"]};border-radius:9px;'
+            f'padding:8px 14px;margin-bottom:5px"><span class="badge {cls}">{label}</span> '
+            f'<b>{r["title"]}</b>{detail}</div>'
+        )
+    st.markdown(html, unsafe_allow_html=True)
+    st.markdown("<hr>", unsafe_allow_html=True)
+
+ANALYTICS_PERIODS = {"آخر 30 يوماً": 30, "آخر 90 يوماً": 90, "آخر سنة": 365}
+
+def _day_matrix(rows, first, last, width=1):
+    """
+    صفوف الملخص (مفتاح، يوم، width قيمة لأيام متتالية) بلا تكرار → DataFrame مفتاح × يوم للأيام [first, last].
+    width=7 لصفوف weekly_points (ما يقع من أسابيعها خارج المدى يُهمل)
+    """
+    days = range(first, last + 1)
+    if not rows:
+        return pd.DataFrame(columns=days, dtype="float32")
+    # fromiter على الصفوف المسطّحة أسرع بكثير من DataFrame.from_records أو np.array للقوائم الكبيرة
+    n = 2 + width
+    flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=float, count=n * len(rows)).reshape(-1, n)
+    keys, row = np.unique(flat[:, 0].astype(np.int64), return_inverse=True)
+    z = np.zeros((len(keys), len(days) + 2 * width), dtype="float32")
+    cols = flat[:, 1].astype(np.int64)[:, None] - first + width + np.arange(width)
+    z[row[:, None], cols] = flat[:, 2:]
+    return pd.DataFrame(z[:, width:width + len(days)], index=keys, columns=days)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def activity_history(version, first, last):
+    """
+    مصفوفتا الأيام السابقة (مستخدم × يوم للنقاط، مهمة × يوم للإنجازات).
+    version = data_version: لا يتغير بإنجازات اليوم، فيبقى هذا الحساب الثقيل مخزناً طوال اليوم.
+    """
+    act = get_activity(first, last)
+    return _day_matrix(act["points"], first, last, 7), _day_matrix(act["tasks"], first, last)
+
+def activity_frames(ndays):
+    """المصفوفتان لآخر ndays يوماً: الأيام السابقة من الذاكرة وعمود اليوم من قاعدة البيانات مباشرة"""
+    t = today()
+    first = t - ndays + 1
+    pts, done = activity_history(get_data_version(), first, t - 1)
+    now = get_activity(t, t)
+    pts  = pts.join(_day_matrix(now["points"], t, t, 7), how="outer").fillna(0)
+    done = done.join(_day_matrix(now["tasks"], t, t), how="outer").fillna(0)
+    return pts, done
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def expected_matrix(version, rules, assignees, first, last):
+    """
+    المتوقع لكل مهمة ويوم = مستحقة في ذلك اليوم × عدد المكلّفين بها حالياً.
+    rules: قواعد تكرار المهام كصفوف tuple (RULE_FIELDS) فتكون هي وassignees جزءاً من مفتاح الذاكرة،
+    ولا تُقيَّم is_due لكل مهمة × يوم إلا عند تغيّر المهام أو المكلفين أو البيانات.
+    """
+    days = range(first, last + 1)
+    due = np.array([[is_due(dict(zip(RULE_FIELDS, r)), d) for d in days] for r in rules], dtype=float)
+    return pd.DataFrame(due * np.array(assignees, dtype=float)[:, None], index=[r[0] for r in rules], columns=days)
+
+RULE_FIELDS = ("id", "recur", "weekdays", "interval_days", "start_day", "end_day", "created_day")
+
+def heatmap(z, x, y, title, height, colorscale, hover):
+    t = T()
+    fig = go.Figure(go.Heatmap(
+        z=z, x=x, y=y, colorscale=colorscale, xgap=1, ygap=1, hoverongaps=False,
+        hovertemplate=hover + "<extra></extra>", colorbar=dict(thickness=10),
+    ))
+    fig.update_layout(title=title, height=height)
+    style_chart(fig)
+    fig.update_xaxes(showgrid=False)
+    fig.update_yaxes(showgrid=False, autorange="reversed", type="category")
+    fig.update_layout(plot_bgcolor=t["surface2"])
+    return fig
+
+def calendar_heatmap(series, title):
+    """تقويم سنوي بنمط أسبوع × يوم من سلسلة قيم مفهرسة بأرقام الأيام"""
+    days = series.index.to_numpy()
+    start = days[0] - date.fromordinal(int(days[0])).weekday()  # اثنين الأسبوع الأول
+    weeks = (days[-1] - start) // 7 + 1
+    z = np.full((7, weeks), np.nan)
+    text = np.full((7, weeks), "", dtype=object)
+    z[(days - start) % 7, (days - start) // 7] = series.to_numpy()
+    text[(days - start) % 7, (days - start) // 7] = [day_iso(int(d)) for d in days]
+    x = [day_iso(int(start + 7 * w)) for w in range(weeks)]
+    fig = heatmap(z, x, list(WEEKDAYS), title, 260,
+                  [[0, T()["surface"]], [1, T()["success"]]], "%{text}<br>%{z:.0f} نقطة")
+    fig.update_traces(text=text)
+    fig.update_xaxes(type="date", tickformat="%b")
+    return fig
+
+def admin_analytics(all_users, all_tasks, groups):
+    t = T()
+    c1, c2 = st.columns(2)
+    ndays = ANALYTICS_PERIODS[c1.selectbox("الفترة", list(ANALYTICS_PERIODS), index=2, key="an_period")]
+    group_opts = {"كل المستخدمين": None} | {g["name"]: g["id"] for g in groups}
+    scope = group_opts[c2.selectbox("النطاق", list(group_opts), key="an_scope")]
+
+    if not all_users:
+        st.info("لا يوجد مستخدمون بعد")
+        return
+    pts, done = activity_frames(ndays)
+    days = list(pts.columns)
+    x = [day_iso(d) for d in days]
+    users = pd.DataFrame(all_users).set_index("id")
+    pts = pts.reindex(users.index, fill_value=0)
+    scale = [[0, t["surface"]], [1, t["accent"]]]
+
+    members = users if scope is None else users[users["group_id"] == scope]
+    scoped = pts.loc[members.index]
+    st.plotly_chart(calendar_heatmap(scoped.sum(), "📅 مجموع النقاط اليومي"), use_container_width=True)
+
+    if groups:
+        gid = users["group_id"].fillna(-1)
+        per_group = pts.groupby(gid.to_numpy()).mean()
+        names = {g["id"]: g["name"] for g in groups}
+        per_group = per_group.loc[[g for g in per_group.index if g in names]]
+        st.plotly_chart(heatmap(
+            per_group.to_numpy(), x, [names[g] for g in per_group.index],
+            "👥 متوسط نقاط العضو في كل مجموعة", 120 + 28 * len(per_group), scale,
+            "%{y}<br>%{x}<br>%{z:.1f} نقطة للعضو",
+        ), use_container_width=True)
+
+    if len(scoped):
+        order = scoped.sum(axis=1).sort_values(ascending=False).index
+        labels = (members["name"] + " · " + members["username"]).loc[order].tolist()
+        st.plotly_chart(heatmap(
+            scoped.loc[order].to_numpy(), x, labels, "👤 نقاط كل مستخدم يومياً",
+            min(120 + 14 * len(order), 1400), scale, "%{y}<br>%{x}<br>%{z:.0f} نقطة",
+        ), use_container_width=True)
+
+    if not all_tasks:
+        return
+    group_size = users.groupby("group_id").size()
+    assignees = tuple(
+        1 if tk["assigned_to"] is not None
+        else int(group_size.get(tk["group_id"], 0)) if tk["group_id"] is not None
+        else len(users)
+        for tk in all_tasks
+    )
+    rules = tuple(tuple(tk[f] for f in RULE_FIELDS) for tk in all_tasks)
+    expected = expected_matrix(get_data_version(), rules, assignees, days[0], days[-1])
+    # إنجاز في يوم غير مستحق (أو من مستخدم نُقل من المجموعة) لا يرفع النسبة فوق 100%
+    done = np.minimum(done.reindex(index=expected.index, columns=days, fill_value=0), expected)
+    rate = done / expected.where(expected > 0) * 100
+    titles = [tk["title"] for tk in all_tasks]
+
+    last7 = days[-7:]
+    table = pd.DataFrame({
+        "المهمة": titles,
+        "التكرار": [recur_label(tk) for tk in all_tasks],
+        "المستحق": expected.sum(axis=1).astype(int).to_numpy(),
+        "المنجز": done.sum(axis=1).astype(int).to_numpy(),
+        "نسبة الإنجاز %": (done.sum(axis=1) / expected.sum(axis=1).replace(0, np.nan) * 100).round(1).to_numpy(),
+        "آخر 7 أيام %": (done[last7].sum(axis=1) / expected[last7].sum(axis=1).replace(0, np.nan) * 100)
+                        .round(1).to_numpy(),
+    }).sort_values("نسبة الإنجاز %")
+    st.markdown('<h3>📋 نسب إنجاز المهام</h3>', unsafe_allow_html=True)
+    st.dataframe(table, use_container_width=True, hide_index=True)
+
+    st.plotly_chart(heatmap(
+        rate.to_numpy(), x, [f"{title} #{tid}" for title, tid in zip(titles, expected.index)],
+        "✅ نسبة إنجاز كل مهمة يومياً (فارغ = غير مستحقة)", min(120 + 18 * len(all_tasks), 1200),
+        [[0, t["danger_soft"]], [0.5, t["warning"]], [1, t["success"]]], "%{y}<br>%{x}<br>%{z:.0f}%",
+    ), use_container_width=True)
+
 def admin_dashboard(user):
     inject_css()
     t = T()
     header_bar(user)
+    admin_search()
 
-    tabs = st.tabs(["📊  لوحة التحكم", "👤  المستخدمون", "👥  المجموعات", "📋  المهام"])
+    tabs = st.tabs(["📊  لوحة التحكم", "👤  المستخدمون", "👥  المجموعات", "📋  المهام", "📈  التحليلات"])
 
     with tabs[0]:
         all_users   = get_all_users()
         all_tasks   = get_tasks()
         groups      = get_groups()
-        comps_today = get_completions(date_=today())
+        lb          = get_leaderboard()
+        comps_today = get_completions(day=today())
         total_pts   = sum(c["points"] for c in comps_today)
 
         c1, c2, c3, c4 = st.columns(4)
@@ -697,11 +766,8 @@ def admin_dashboard(user):
         st.markdown("<div style='height:10px'></div>", unsafe_allow_html=True)
 
         # إجمالي 7 أيام
-        days = last_7_days()
-        df_d = pd.DataFrame([
-            {"اليوم": d, "النقاط": sum(c["points"] for c in get_completions(date_=d))}
-            for d in days
-        ])
+        daily = get_daily_points(last_7_days())
+        df_d = pd.DataFrame([{"اليوم": day_iso(d), "النقاط": p} for d, p in daily.items()])
         fig_d = px.bar(df_d, x="اليوم", y="النقاط",
                        title="إجمالي النقاط – آخر 7 أيام",
                        color_discrete_sequence=[t["accent"]])
@@ -713,8 +779,7 @@ def admin_dashboard(user):
         with col_l:
             if groups:
                 gd = [{"المجموعة": g["name"],
-                        "النقاط": sum(sum(c["points"] for c in get_completions(m["id"], today()))
-                                      for m in [u for u in all_users if u.get("group_id") == g["id"]])}
+                        "النقاط": sum(r["pts"] for r in lb if r["group_id"] == g["id"])}
                       for g in groups]
                 df_g = pd.DataFrame(gd)
                 fig_g = px.bar(df_g, x="المجموعة", y="النقاط",
@@ -724,12 +789,7 @@ def admin_dashboard(user):
                 st.plotly_chart(style_chart(fig_g), use_container_width=True)
 
         with col_r:
-            user_stats = sorted([
-                {"id": u["id"], "الاسم": u["name"],
-                 "النقاط": compute_user_stats(u["id"], all_tasks)[0],
-                 "pct": compute_user_stats(u["id"], all_tasks)[3]}
-                for u in all_users
-            ], key=lambda x: x["النقاط"], reverse=True)
+            user_stats = [{"id": r["id"], "الاسم": r["name"], "النقاط": r["pts"], "pct": r["pct"]} for r in lb]
             if user_stats:
                 df_u = pd.DataFrame(user_stats)
                 fig_u = px.bar(df_u, x="الاسم", y="النقاط",
@@ -739,14 +799,20 @@ def admin_dashboard(user):
                 st.plotly_chart(style_chart(fig_u), use_container_width=True)
 
         st.markdown('<h3>🏆 لوحة الشرف</h3>', unsafe_allow_html=True)
-        lb = sorted([
-            {**u,
-             "pts": sum(c["points"] for c in get_completions(u["id"], today())),
-             "pct": compute_user_stats(u["id"], all_tasks)[3]}
-            for u in all_users
-        ], key=lambda x: x["pts"], reverse=True)
         st.markdown(leaderboard_html(lb, groups), unsafe_allow_html=True)
 
+        with st.expander("🗄  أرشفة الإنجازات القديمة"):
+            with st.form("archive"):
+                arch_days = st.number_input("أرشفة الإنجازات الأقدم من (يوم)", min_value=1, value=ARCHIVE_AFTER_DAYS)
+                arch_vacuum = st.checkbox("ضغط ملف قاعدة البيانات بعد النقل (VACUUM)")
+                if st.form_submit_button("تشغيل الأرشفة", use_container_width=True):
+                    rep = archive_completions(int(arch_days), vacuum=arch_vacuum)
+                    st.success(
+                        f'✅ نُقل {rep["rows"]} صف ({len(rep["months"])} شهر) — '
+                        f'{rep["archive_bytes"] / 1024:.1f} KB إلى الأرشيف، '
+                        f'{rep["freed_bytes"] / 1024:.1f} KB حُررت من الجدول الحي'
+                    )
+
     with tabs[1]:
         groups = get_groups()
         group_opts = {"بدون مجموعة": ""} | {g["name"]: g["id"] for g in groups}
@@ -821,16 +887,21 @@ def admin_dashboard(user):
                 unsafe_allow_html=True
             )
             c2.markdown(f'<span class="badge badge-gold">⭐ {int(gpts)} اليوم</span>', unsafe_allow_html=True)
-            if c3.button("🗑 حذف", key=f"del_g_{g['id']}", use_container_width=True):
+            if c3.button("🗑 حذف", key=f"del_g_{g['id']}", use_container_width=True,
+                         help="تُحذف مهام المجموعة وإنجازاتها معها، ويبقى الأعضاء بلا مجموعة"):
                 delete_group(g["id"]); st.rerun()
             st.divider()
 
     with tabs[3]:
         all_users = get_all_users()
         all_tasks = get_tasks()
-        user_opts = {"الجميع": "all"} | {u["name"]: u["id"] for u in all_users}
+        groups    = get_groups()
+        user_opts = ({"الجميع": ("all", None)}
+                     | {f'👥 {g["name"]}': (None, g["id"]) for g in groups}
+                     | {u["name"]: (u["id"], None) for u in all_users})
 
         with st.expander("➕  إضافة مهمة جديدة"):
+            a_recur = recur_select("add_task")
             with st.form("add_task"):
                 t_title    = st.text_input("عنوان المهمة", placeholder="مثال: قراءة كتاب")
                 c1, c2     = st.columns(2)
@@ -853,22 +924,48 @@ def admin_dashboard(user):
                             unsafe_allow_html=True
                         )
 
+                sched = schedule_inputs("add_task", a_recur)
+
                 if st.form_submit_button("إضافة المهمة ←", use_container_width=True):
-                    if t_title:
+                    if t_title and schedule_error(sched):
+                        st.warning(schedule_error(sched))
+                    elif t_title:
                         task_type = "check" if "عادي" in t_type else "numeric"
-                        add_task(t_title, user_opts[t_assigned], task_type, t_pts, t_unit, t_ppu, t_target)
+                        a_user, a_group = user_opts[t_assigned]
+                        add_task(t_title, a_user, task_type, t_pts, t_unit, t_ppu, t_target,
+                                 group_id=a_group, **sched)
                         st.success("✅ تمت إضافة المهمة"); st.rerun()
 
+        if all_tasks:
+            with st.expander("🔁  تعديل تكرار مهمة"):
+                # خارج النموذج حتى تُملأ الحقول بقاعدة المهمة المختارة فور تغييرها
+                by_id = {tk["id"]: tk for tk in all_tasks}
+                e_task = by_id[st.selectbox("المهمة", list(by_id), format_func=lambda i: by_id[i]["title"],
+                                            key="sched_task")]
+                st.caption(f"الحالية: {recur_label(e_task)}")
+                e_recur = recur_select(f"sched_{e_task['id']}", e_task)
+                with st.form(f"sched_{e_task['id']}"):
+                    sched = schedule_inputs(f"sched_{e_task['id']}", e_recur, e_task)
+                    if st.form_submit_button("حفظ التكرار", use_container_width=True):
+                        if schedule_error(sched):
+                            st.warning(schedule_error(sched))
+                        else:
+                            update_task_schedule(e_task["id"], **sched)
+                            st.success("✅ تم تحديث التكرار"); st.rerun()
+
         st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
-        comps_today = get_completions(date_=today())
+        comps_today = get_completions(day=today())
         if not all_tasks:
             st.info("لا توجد مهام بعد.")
 
         for task in all_tasks:
             task_comps = [c for c in comps_today if c["task_id"] == task["id"]]
-            assignee   = "الجميع" if task["assigned_to"] == "all" else next(
-                (u["name"] for u in all_users if u["id"] == task["assigned_to"]), "—"
-            )
+            if task["group_id"] is not None:
+                assignee = "👥 " + next((g["name"] for g in groups if g["id"] == task["group_id"]), "—")
+            else:
+                assignee = "الجميع" if task["assigned_to"] is None else next(
+                    (u["name"] for u in all_users if u["id"] == task["assigned_to"]), "—"
+                )
             info = (f'⭐ {task["points"]} نقطة' if task["task_type"] == "check"
                     else f'📊 {task["points_per_unit"]} نق/{task["unit"]} × {task["target_units"]:.0f}')
             c1, c2 = st.columns([5, 1])
@@ -879,6 +976,7 @@ def admin_dashboard(user):
                 f'<div style="margin-top:7px">'
                 f'<span class="badge badge-blue">👤 {assignee}</span>'
                 f'<span class="badge badge-gold">{info}</span>'
+                f'<span class="badge badge-purple">🔁 {recur_label(task)}</span>'
                 f'<span class="badge badge-green">✅ {len(task_comps)} اليوم</span>'
                 f'</div></div>',
                 unsafe_allow_html=True
@@ -887,20 +985,26 @@ def admin_dashboard(user):
                 delete_task(task["id"]); st.rerun()
             st.markdown("<div style='height:4px'></div>", unsafe_allow_html=True)
 
+    with tabs[4]:
+        # كل التبويبات تُرسم في كل rerun؛ الرسوم الكبيرة تُحمَّل عند الطلب فقط
+        if st.toggle("عرض التحليلات", key="an_on"):
+            admin_analytics(get_all_users(), get_tasks(), get_groups())
+
 # ─────────────────────────────────────────────
 # نقطة الدخول
 # ─────────────────────────────────────────────
 def main():
     init_db()
-    if "user" not in st.session_state:
-        st.session_state.user = None
+    # الجلسة تحفظ الرمز فقط؛ السجل يُقرأ من ذاكرة db فيظهر أثر حذف المستخدم أو نقله لمجموعة أخرى
+    user = get_session_user(st.session_state.get("token"))
 
-    if not st.session_state.user:
+    if not user:
+        st.session_state.token = None
         login_page()
-    elif st.session_state.user["role"] == "admin":
-        admin_dashboard(st.session_state.user)
+    elif user["role"] == "admin":
+        admin_dashboard(user)
     else:
-        user_dashboard(st.session_state.user)
+        user_dashboard(user)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,1912 @@
+"""
+طبقة البيانات لمنصة المهام
+تُستخدم من واجهة Streamlit في app.py ومن أوامر الإدارة في manage.py
+
+دوال البيانات العامة تمر بكائن Backend: SQLiteBackend (ملف على القرص) أو MemoryBackend (قواميس
+في الذاكرة). يُختار بـ TASKS_BACKEND (sqlite | memory) ومساره بـ TASKS_DB و TASKS_ARCHIVE_DB،
+أو بتعيين db.BACKEND / db.DB / db.ARCHIVE_DB في أي وقت.
+
+المفاتيح الداخلية أعداد صحيحة (rowid) والتواريخ أرقام أيام (date.toordinal)،
+أما المعرّفات النصية فتبقى في عمود uid كمعرّفات خارجية.
+"""
+
+import os
+import re
+import sqlite3
+import functools
+import hashlib
+import hmac
+import itertools
+import secrets
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import date
+from contextlib import contextmanager
+
+# ─────────────────────────────────────────────
+# قاعدة البيانات
+# ─────────────────────────────────────────────
+BACKEND = os.environ.get("TASKS_BACKEND", "sqlite")
+DB = os.environ.get("TASKS_DB", "tasks.db")
+ARCHIVE_DB = os.environ.get("TASKS_ARCHIVE_DB", "tasks_archive.db")
+# الإنجازات الأقدم من هذا العدد من الأيام تُنقل إلى ملف الأرشيف
+ARCHIVE_AFTER_DAYS = int(os.environ.get("TASKS_ARCHIVE_AFTER_DAYS", "90"))
+# عدد الأيام القادمة المحسوبة مسبقاً في فهرس المهام المستحقة task_due
+DUE_HORIZON_DAYS = 60
+# كلفة scrypt لكلمات المرور (2**14 ≈ 50ms للدخول)؛ تغييرها يُطبَّق على كل مستخدم عند دخوله التالي
+PW_SCRYPT_N = int(os.environ.get("TASKS_SCRYPT_N", str(2 ** 14)))
+# مدة صلاحية جلسة الدخول، ومدة بقاء سجل المستخدم في ذاكرة العملية قبل إعادة قراءته
+SESSION_TTL_HOURS = int(os.environ.get("TASKS_SESSION_TTL_HOURS", "12"))
+USER_CACHE_TTL = 60
+
+SCHEMA_VERSION = 2
+# julianday(d) - _JD_OFFSET == date.toordinal(d)
+_JD_OFFSET = 1721424.5
+
+SCHEMA = """
+-- AUTOINCREMENT في users وgroups_ وtasks: معرّف السجل المحذوف لا يُعطى لسجل جديد، فما بقي يشير إليه
+-- (مهام مستخدم محذوف مثلاً) لا ينتقل إلى من يأتي بعده
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT UNIQUE NOT NULL,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    role TEXT DEFAULT 'user',
+    group_id INTEGER,
+    search_title TEXT DEFAULT '',
+    search_detail TEXT DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_users_group ON users(group_id);
+CREATE TABLE IF NOT EXISTS groups_ (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    search_title TEXT DEFAULT ''
+);
+-- assigned_to: مستخدم، group_id: مجموعة، وكلاهما NULL تعني "الجميع"
+-- recur: daily | weekly (weekdays قناع بتات، الاثنين = 1) | interval (كل interval_days يوم) | once
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT UNIQUE NOT NULL,
+    title TEXT NOT NULL,
+    assigned_to INTEGER,
+    task_type TEXT DEFAULT 'check',
+    points INTEGER DEFAULT 10,
+    unit TEXT DEFAULT '',
+    points_per_unit REAL DEFAULT 1.0,
+    target_units REAL DEFAULT 1.0,
+    created_day INTEGER,
+    recur TEXT DEFAULT 'daily',
+    weekdays INTEGER DEFAULT 127,
+    interval_days INTEGER DEFAULT 1,
+    start_day INTEGER,
+    end_day INTEGER,
+    group_id INTEGER,
+    search_title TEXT DEFAULT '',
+    search_detail TEXT DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_assignee ON tasks(assigned_to, group_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_group ON tasks(group_id);
+-- فهرس مادي: المهام المستحقة في كل يوم، يُحدَّث عند تغيّر المهام بدل تقييم القواعد عند العرض
+CREATE TABLE IF NOT EXISTS task_due (
+    day INTEGER NOT NULL,
+    task_id INTEGER NOT NULL,
+    PRIMARY KEY (day, task_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_task_due_task ON task_due(task_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+-- إحصاءات تراكمية لكل مستخدم تُحدَّث مع كل كتابة إنجاز (O(1) عند العرض).
+-- base_* = الحالة حتى نهاية اليوم السابق لـ day، وday_points = نقاط اليوم المفتوح day؛
+-- فالتراجع يعيد حساب day_points فقط ولا يفسد السلاسل أو أفضل يوم.
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY,
+    day INTEGER NOT NULL,
+    day_points REAL DEFAULT 0.0,
+    base_lifetime REAL DEFAULT 0.0,
+    base_last_day INTEGER,
+    base_streak INTEGER DEFAULT 0,
+    base_longest INTEGER DEFAULT 0,
+    base_best_points REAL DEFAULT 0.0,
+    base_best_day INTEGER
+);
+-- بحث نصي موحّد (FTS5) في المهام والمستخدمين والمجموعات، تحدّثه المشغلات تلقائياً.
+-- المشغلات تنسخ عمودي search_title/search_detail كما هما (SQL عادي، فالكتابة من sqlite3 أو
+-- سكربتات النسخ الاحتياطي لا تحتاج دوال Python). يملؤهما add_task/add_user/add_group بـ ar_index:
+-- توحيد الهمزات والتاء المربوطة وحذف التشكيل مع الكلمة بدون "ال" ليطابق البحث "تطو" كلمة "التطوير".
+-- تعديل العنوان أو الاسم من خارج db.py يحتاج تحديث search_title معه.
+-- rowid = id * 4 + نوع السجل (1 مهمة، 2 مستخدم، 3 مجموعة)
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED, ref UNINDEXED, title, detail,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+CREATE TRIGGER IF NOT EXISTS tasks_search_ai AFTER INSERT ON tasks BEGIN
+    INSERT INTO search_index (rowid, kind, ref, title, detail)
+    VALUES (new.id * 4 + 1, 'task', new.id, new.search_title, new.search_detail);
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_search_au AFTER UPDATE OF search_title, search_detail ON tasks BEGIN
+    UPDATE search_index SET title = new.search_title, detail = new.search_detail WHERE rowid = new.id * 4 + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_search_ad AFTER DELETE ON tasks BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS users_search_ai AFTER INSERT ON users BEGIN
+    INSERT INTO search_index (rowid, kind, ref, title, detail)
+    VALUES (new.id * 4 + 2, 'user', new.id, new.search_title, new.search_detail);
+END;
+CREATE TRIGGER IF NOT EXISTS users_search_au AFTER UPDATE OF search_title, search_detail ON users BEGIN
+    UPDATE search_index SET title = new.search_title, detail = new.search_detail WHERE rowid = new.id * 4 + 2;
+END;
+CREATE TRIGGER IF NOT EXISTS users_search_ad AFTER DELETE ON users BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 2;
+END;
+CREATE TRIGGER IF NOT EXISTS groups_search_ai AFTER INSERT ON groups_ BEGIN
+    INSERT INTO search_index (rowid, kind, ref, title, detail)
+    VALUES (new.id * 4 + 3, 'group', new.id, new.search_title, '');
+END;
+CREATE TRIGGER IF NOT EXISTS groups_search_au AFTER UPDATE OF search_title ON groups_ BEGIN
+    UPDATE search_index SET title = new.search_title WHERE rowid = new.id * 4 + 3;
+END;
+CREATE TRIGGER IF NOT EXISTS groups_search_ad AFTER DELETE ON groups_ BEGIN
+    DELETE FROM search_index WHERE rowid = old.id * 4 + 3;
+END;
+-- رموز الوصول لواجهة JSON (api.py)، يُخزَّن SHA-256 للرمز فقط
+CREATE TABLE IF NOT EXISTS api_tokens (
+    token_hash TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    label TEXT DEFAULT '',
+    created_day INTEGER
+) WITHOUT ROWID;
+-- جلسات الدخول للواجهة؛ expires بثواني unix
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    expires INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS completions (
+    user_id INTEGER NOT NULL,
+    task_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    units REAL DEFAULT 1.0,
+    points REAL DEFAULT 0.0,
+    PRIMARY KEY (user_id, day, task_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_completions_day ON completions(day);
+CREATE INDEX IF NOT EXISTS idx_completions_task ON completions(task_id);
+-- مجاميع كل مستخدم في كل يوم، للأيام الحية والمؤرشفة معاً: تحدّثها مشغلات completions مع كل كتابة
+-- (SUMMARY_TRIGGERS)، والأرشفة تنقل الإنجازات دون أن تمسّها. منها تُقرأ الرسوم والتحليلات والسلاسل
+-- فلا يُمسح جدول الإنجازات الكبير عند العرض.
+CREATE TABLE IF NOT EXISTS daily_summary (
+    user_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    points REAL DEFAULT 0.0,
+    done INTEGER DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_daily_summary_day ON daily_summary(day);
+-- والمثل لكل مهمة
+CREATE TABLE IF NOT EXISTS task_daily_summary (
+    task_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    done INTEGER DEFAULT 0,
+    points REAL DEFAULT 0.0,
+    PRIMARY KEY (task_id, day)
+) WITHOUT ROWID;
+-- daily_summary مقلوباً إلى صف لكل مستخدم وأسبوع (d0 = الاثنين، week = (day - 1) / 7) تحدّثه مشغلاته:
+-- سنة لألفي مستخدم ~100 ألف صف بدل 730 ألفاً، وجلب الصفوف في Python هو أغلى جزء في التحليلات.
+CREATE TABLE IF NOT EXISTS weekly_points (
+    user_id INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    d0 REAL DEFAULT 0.0, d1 REAL DEFAULT 0.0, d2 REAL DEFAULT 0.0, d3 REAL DEFAULT 0.0,
+    d4 REAL DEFAULT 0.0, d5 REAL DEFAULT 0.0, d6 REAL DEFAULT 0.0,
+    PRIMARY KEY (user_id, week)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_weekly_points_week ON weekly_points(week);
+"""
+
+# data_version مفتاح ذاكرة التحليلات: يزداد مع أي تغيير في ملخصات الأيام السابقة.
+# إنجازات اليوم لا تغيّره لأن عمود اليوم يُقرأ دائماً مباشرة.
+_TODAY_SQL = f"CAST(julianday('now', 'localtime') - {_JD_OFFSET} AS INTEGER)"
+_VERSION_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {name}_version_{kind} AFTER {op} ON {table} WHEN {day} < {today} BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'data_version';
+END;"""
+SCHEMA += "INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0);" + "".join(
+    _VERSION_TRIGGER.format(
+        name=table, kind=op.lower(), op=op, table=table, today=_TODAY_SQL,
+        day={"INSERT": "new.day", "UPDATE": "min(old.day, new.day)", "DELETE": "old.day"}[op],
+    )
+    for table in ("daily_summary", "task_daily_summary")
+    for op in ("INSERT", "UPDATE", "DELETE")
+) + "\n"
+
+# تحديث الملخصين مع كل كتابة في completions (SQL عادي: يعمل من أي اتصال).
+# حذف الأرشفة يضع المفتاح archiving في meta داخل معاملته فلا يُنقص الملخص.
+# INSERT OR REPLACE لا يشغّل مشغل الحذف (ما لم يُفعَّل recursive_triggers)، لذا تكتب db.py بـ ON CONFLICT DO UPDATE.
+_SUMMARY_ADD = """
+    INSERT INTO daily_summary (user_id, day, points, done) VALUES (new.user_id, new.day, new.points, 1)
+        ON CONFLICT(user_id, day) DO UPDATE SET points = points + excluded.points, done = done + 1;
+    INSERT INTO task_daily_summary (task_id, day, done, points) VALUES (new.task_id, new.day, 1, new.points)
+        ON CONFLICT(task_id, day) DO UPDATE SET done = done + 1, points = points + excluded.points;"""
+_SUMMARY_SUB = """
+    UPDATE daily_summary SET points = points - old.points, done = done - 1
+        WHERE user_id = old.user_id AND day = old.day;
+    DELETE FROM daily_summary WHERE user_id = old.user_id AND day = old.day AND done <= 0;
+    UPDATE task_daily_summary SET done = done - 1, points = points - old.points
+        WHERE task_id = old.task_id AND day = old.day;
+    DELETE FROM task_daily_summary WHERE task_id = old.task_id AND day = old.day AND done <= 0;"""
+_WEEK_COLS = ", ".join(f"d{k}" for k in range(7))
+_WEEK_CELLS = ", ".join(f"CASE WHEN ({{r}}.day - 1) % 7 = {k} THEN {{r}}.points ELSE 0 END" for k in range(7))
+_WEEKLY_ADD = f"""
+    INSERT INTO weekly_points (user_id, week, {_WEEK_COLS}) VALUES (new.user_id, (new.day - 1) / 7, {_WEEK_CELLS.format(r="new")})
+        ON CONFLICT(user_id, week) DO UPDATE SET {", ".join(f"d{k} = d{k} + excluded.d{k}" for k in range(7))};"""
+_WEEKLY_SUB = f"""
+    UPDATE weekly_points SET {", ".join(
+        f"d{k} = d{k} - CASE WHEN (old.day - 1) % 7 = {k} THEN old.points ELSE 0 END" for k in range(7))}
+        WHERE user_id = old.user_id AND week = (old.day - 1) / 7;"""
+SUMMARY_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS completions_summary_ai AFTER INSERT ON completions BEGIN{_SUMMARY_ADD}
+END;
+CREATE TRIGGER IF NOT EXISTS completions_summary_au AFTER UPDATE OF user_id, task_id, day, points ON completions
+BEGIN{_SUMMARY_SUB}{_SUMMARY_ADD}
+END;
+CREATE TRIGGER IF NOT EXISTS completions_summary_ad AFTER DELETE ON completions
+WHEN NOT EXISTS (SELECT 1 FROM meta WHERE key = 'archiving') BEGIN{_SUMMARY_SUB}
+END;
+CREATE TRIGGER IF NOT EXISTS daily_summary_weekly_ai AFTER INSERT ON daily_summary BEGIN{_WEEKLY_ADD}
+END;
+CREATE TRIGGER IF NOT EXISTS daily_summary_weekly_au AFTER UPDATE OF user_id, day, points ON daily_summary
+BEGIN{_WEEKLY_SUB}{_WEEKLY_ADD}
+END;
+CREATE TRIGGER IF NOT EXISTS daily_summary_weekly_ad AFTER DELETE ON daily_summary BEGIN{_WEEKLY_SUB}
+END;
+"""
+
+ARCHIVE_TABLE = """
+CREATE TABLE IF NOT EXISTS archive.{table} (
+    user_id INTEGER NOT NULL,
+    task_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    units REAL DEFAULT 1.0,
+    points REAL DEFAULT 0.0,
+    PRIMARY KEY (user_id, day, task_id)
+) WITHOUT ROWID
+"""
+
+# ─────────────────────────────────────────────
+# النصوص وكلمات المرور والأيام
+# ─────────────────────────────────────────────
+_AR_NORM = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ة": "ه", "ى": "ي", "ؤ": "و", "ئ": "ي", "ـ": None,
+    **{chr(c): None for c in range(0x064B, 0x0660)}, "\u0670": None,
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+})
+
+def ar_norm(text):
+    """تطبيع النص للبحث: حذف التشكيل والتطويل وتوحيد الألف والتاء المربوطة والياء"""
+    return text.translate(_AR_NORM).lower() if text else ""
+
+def ar_index(text):
+    """نص الفهرسة: ar_norm مضافاً إليه الكلمات المعرّفة بـ"ال" بدون أداة التعريف"""
+    words = ar_norm(text).split()
+    bare = [w[len(p):] for w in words for p in ("وال", "بال", "ال") if w.startswith(p) and len(w) - len(p) >= 2]
+    return " ".join(words + bare)
+
+def hash_pw(pw, n=None):
+    """scrypt$n$r$p$salt$hash — الملح عشوائي لكل كلمة مرور"""
+    n, r, p = n or PW_SCRYPT_N, 8, 1
+    salt = secrets.token_bytes(16)
+    dk = hashlib.scrypt(pw.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r)
+    return f"scrypt${n}${r}${p}${salt.hex()}${dk.hex()}"
+
+def verify_pw(pw, stored):
+    """(مطابقة؟، تحتاج إعادة تجزئة؟) — تقبل تجزئات SHA-256 القديمة بدون ملح"""
+    if not stored.startswith("scrypt$"):
+        return hmac.compare_digest(hashlib.sha256(pw.encode()).hexdigest(), stored), True
+    _, n, r, p, salt, dk = stored.split("$")
+    n, r, p = int(n), int(r), int(p)
+    calc = hashlib.scrypt(pw.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p, maxmem=256 * n * r)
+    return hmac.compare_digest(calc.hex(), dk), n != PW_SCRYPT_N
+
+def gen_id(): return uuid.uuid4().hex
+def to_day(d): return (date.fromisoformat(d) if isinstance(d, str) else d).toordinal()
+def day_iso(n): return date.fromordinal(n).isoformat()
+def today(): return date.today().toordinal()
+def last_7_days():
+    t = today()
+    return list(range(t - 6, t + 1))
+
+
+# ─────────────────────────────────────────────
+# ترحيل المخطط
+# ─────────────────────────────────────────────
+# كل ترحيل يأخذ (اتصال القاعدة الرئيسية، مسار ملف الأرشيف)
+def _migrate_1_to_2(conn, archive_path):
+    """
+    المخطط 1 (app.py الأصلي): معرّفات TEXT مختصرة وتواريخ ISO في date_، ومعه daily_summary وجداول
+    أرشيف بعمود date_ إن كانت الأرشفة قد شُغّلت.
+    المخطط 2: SCHEMA الحالي بمفاتيح INTEGER وأرقام أيام، والمعرّف القديم يُحفظ في uid.
+    الترحيل كله معاملة واحدة: المشغلات تبني الملخصات وweekly_points والفهرس النصي أثناء النسخ،
+    ثم يُملأ نص البحث وuser_stats مرة واحدة.
+    """
+    t = today()
+    archived = os.path.exists(archive_path)
+    if archived:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))  # ATTACH غير مسموح داخل معاملة
+    try:
+        conn.executescript(f"""
+        BEGIN;
+        DROP INDEX IF EXISTS idx_completions_date;
+        DROP INDEX IF EXISTS idx_daily_summary_date;
+        ALTER TABLE users RENAME TO _v1_users;
+        ALTER TABLE groups_ RENAME TO _v1_groups;
+        ALTER TABLE tasks RENAME TO _v1_tasks;
+        ALTER TABLE completions RENAME TO _v1_completions;
+        CREATE TABLE IF NOT EXISTS daily_summary (user_id TEXT, date_ TEXT, points REAL, done INTEGER);
+        ALTER TABLE daily_summary RENAME TO _v1_daily_summary;
+        {SCHEMA}
+        {SUMMARY_TRIGGERS}
+        INSERT INTO groups_ (uid, name)
+            SELECT id, name FROM _v1_groups ORDER BY rowid;
+        INSERT INTO users (uid, username, password_hash, name, role, group_id)
+            SELECT u.id, u.username, u.password_hash, u.name, u.role, g.id
+            FROM _v1_users u LEFT JOIN groups_ g ON g.uid = u.group_id ORDER BY u.rowid;
+        INSERT INTO tasks (uid, title, assigned_to, task_type, points, unit, points_per_unit, target_units,
+                           created_day, start_day)
+            SELECT t.id, t.title, u.id, t.task_type, t.points, t.unit, t.points_per_unit, t.target_units,
+                   CAST(julianday(t.created_at) - {_JD_OFFSET} AS INTEGER),
+                   COALESCE(CAST(julianday(t.created_at) - {_JD_OFFSET} AS INTEGER), {t})
+            FROM _v1_tasks t LEFT JOIN users u ON u.uid = t.assigned_to
+            WHERE t.assigned_to = 'all' OR u.id IS NOT NULL
+            ORDER BY t.rowid;
+        INSERT OR IGNORE INTO completions (user_id, task_id, day, units, points)
+            SELECT u.id, t.id, CAST(julianday(c.date_) - {_JD_OFFSET} AS INTEGER), c.units, c.points
+            FROM _v1_completions c
+            JOIN users u ON u.uid = c.user_id
+            JOIN tasks t ON t.uid = c.task_id;
+        INSERT INTO daily_summary (user_id, day, points, done)
+            SELECT u.id, CAST(julianday(s.date_) - {_JD_OFFSET} AS INTEGER), s.points, s.done
+            FROM _v1_daily_summary s JOIN users u ON u.uid = s.user_id WHERE true
+            ON CONFLICT(user_id, day) DO UPDATE SET points = points + excluded.points, done = done + excluded.done;
+        DROP TABLE _v1_users;
+        DROP TABLE _v1_groups;
+        DROP TABLE _v1_tasks;
+        DROP TABLE _v1_completions;
+        DROP TABLE _v1_daily_summary;
+        """)
+        if archived:
+            _migrate_archive_1_to_2(conn)
+        conn.executemany("UPDATE tasks SET search_title=?, search_detail=? WHERE id=?", [
+            (ar_index(r[1]), ar_index(r[2]), r[0]) for r in conn.execute("SELECT id, title, unit FROM tasks")
+        ])
+        conn.executemany("UPDATE users SET search_title=?, search_detail=? WHERE id=?", [
+            (ar_index(r[1]), ar_index(r[2]), r[0]) for r in conn.execute("SELECT id, name, username FROM users")
+        ])
+        conn.executemany("UPDATE groups_ SET search_title=? WHERE id=?", [
+            (ar_index(r[1]), r[0]) for r in conn.execute("SELECT id, name FROM groups_")
+        ])
+        _rebuild_user_stats(conn)
+        conn.execute("PRAGMA user_version = 2")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if archived:
+            conn.execute("DETACH DATABASE archive")
+
+def _migrate_archive_1_to_2(conn):
+    """جداول الأرشيف إلى مفاتيح INTEGER وأرقام أيام، وأيامها في task_daily_summary (daily_summary يحويها أصلاً)"""
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM archive.sqlite_master WHERE type='table' AND name LIKE 'completions_%'"
+    ).fetchall()]
+    for table in tables:
+        cols = [r[1] for r in conn.execute(f"PRAGMA archive.table_info({table})").fetchall()]
+        if "date_" not in cols:
+            continue
+        # الصفوف التي حُذف مستخدمها أو مهمتها لا يمكن ربطها بمفتاح صحيح، ونقاطها باقية في daily_summary
+        conn.execute(f"ALTER TABLE archive.{table} RENAME TO _v1_{table}")
+        conn.execute(ARCHIVE_TABLE.format(table=table))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO archive.{table} (user_id, task_id, day, units, points)
+            SELECT u.id, t.id, CAST(julianday(c.date_) - {_JD_OFFSET} AS INTEGER), c.units, c.points
+            FROM archive._v1_{table} c
+            JOIN users u ON u.uid = c.user_id
+            JOIN tasks t ON t.uid = c.task_id
+        """)
+        conn.execute(f"DROP TABLE archive._v1_{table}")
+        conn.execute(f"""
+            INSERT INTO task_daily_summary (task_id, day, done, points)
+            SELECT task_id, day, COUNT(*), SUM(points) FROM archive.{table} WHERE true GROUP BY task_id, day
+            ON CONFLICT(task_id, day) DO UPDATE SET done = done + excluded.done, points = points + excluded.points
+        """)
+
+MIGRATIONS = {1: _migrate_1_to_2}
+
+# ─────────────────────────────────────────────
+# التكرار والتعيين
+# ─────────────────────────────────────────────
+def is_due(task, day):
+    """هل المهمة مستحقة في اليوم day حسب قاعدة تكرارها"""
+    start = task["start_day"] or task["created_day"] or day
+    if day < start or (task["end_day"] is not None and day > task["end_day"]):
+        return False
+    recur = task["recur"] or "daily"
+    if recur == "weekly":
+        return bool(task["weekdays"] & (1 << date.fromordinal(day).weekday()))
+    if recur == "interval":
+        return (day - start) % max(task["interval_days"] or 1, 1) == 0
+    if recur == "once":
+        return day == start
+    return True
+
+def is_assigned(task, uid, group_id=None):
+    if task["group_id"] is not None:
+        return task["group_id"] == group_id
+    return task["assigned_to"] is None or task["assigned_to"] == uid
+
+def _item_error(it, task, groups, due):
+    """سبب رفض عنصر من submit_completions أو None؛ groups: {user_id: group_id} للمستخدمين الموجودين"""
+    uid = it["user_id"]
+    if uid not in groups or task is None:
+        return "unknown user or task"
+    if task["id"] not in due or not is_assigned(task, uid, groups[uid]):
+        return "task not due for user"
+    units = it.get("units")
+    # bool فرع من int في Python، و"units": true لا يعني وحدة واحدة
+    if task["task_type"] != "check" and (isinstance(units, bool) or not isinstance(units, (int, float))
+                                         or not 0 < units <= task["target_units"]):
+        return f"units must be in (0, {task['target_units']}]"
+    return None
+
+def _materialize_due(conn, tasks, first, last):
+    rows = [(d, t["id"]) for t in tasks for d in range(first, last + 1) if is_due(t, d)]
+    conn.executemany("INSERT OR IGNORE INTO task_due (day, task_id) VALUES (?,?)", rows)
+
+# ─────────────────────────────────────────────
+# الإحصاءات التراكمية (السلاسل والمجاميع)
+# ─────────────────────────────────────────────
+def _fold_day(st):
+    """إغلاق اليوم المفتوح st["day"] ودمجه في base_*"""
+    d, p = st["day"], st["day_points"]
+    if p > 0:
+        st["base_lifetime"] += p
+        st["base_streak"] = st["base_streak"] + 1 if st["base_last_day"] == d - 1 else 1
+        st["base_last_day"] = d
+        st["base_longest"] = max(st["base_longest"], st["base_streak"])
+        if p > st["base_best_points"]:
+            st["base_best_points"], st["base_best_day"] = p, d
+    st["day_points"] = 0.0
+
+def _new_stats(user_id, day):
+    return {"user_id": user_id, "day": day, "day_points": 0.0, "base_lifetime": 0.0, "base_last_day": None,
+            "base_streak": 0, "base_longest": 0, "base_best_points": 0.0, "base_best_day": None}
+
+def _build_stats(user_ids, rows, t):
+    """user_stats لكل مستخدم من صفوف (user_id, day, points) مرتبة بالمستخدم ثم اليوم"""
+    stats = {uid: _new_stats(uid, t) for uid in user_ids}
+    for uid, day, pts in rows:
+        st = stats.get(uid)
+        if st is None:
+            continue
+        if day >= t:
+            st["day_points"] += pts
+            continue
+        st["day"], st["day_points"] = day, pts
+        _fold_day(st)
+        st["day"] = t
+    return stats
+
+def _save_stats(conn, st):
+    conn.execute(
+        "INSERT OR REPLACE INTO user_stats (user_id, day, day_points, base_lifetime, base_last_day, base_streak,"
+        " base_longest, base_best_points, base_best_day) VALUES (?,?,?,?,?,?,?,?,?)",
+        (st["user_id"], st["day"], st["day_points"], st["base_lifetime"], st["base_last_day"],
+         st["base_streak"], st["base_longest"], st["base_best_points"], st["base_best_day"])
+    )
+
+def _touch_user_stats(conn, user_id, day):
+    """يُستدعى داخل معاملة الكتابة بعد تعديل إنجازات المستخدم في اليوم day"""
+    row = conn.execute("SELECT * FROM user_stats WHERE user_id=?", (user_id,)).fetchone()
+    st = dict(row) if row else _new_stats(user_id, day)
+    if day < st["day"]:
+        return  # كتابة على يوم مُغلق: تُصحَّح بـ rebuild_user_stats
+    if day > st["day"]:
+        _fold_day(st)
+        st["day"] = day
+    st["day_points"] = conn.execute(
+        "SELECT COALESCE(SUM(points), 0) FROM completions WHERE user_id=? AND day=?", (user_id, day)
+    ).fetchone()[0]
+    _save_stats(conn, st)
+
+def _rebuild_user_stats(conn, user_ids=None):
+    """user_stats من daily_summary لكل المستخدمين أو لـ user_ids فقط"""
+    where, params = "", []
+    if user_ids is not None:
+        params = list(user_ids)
+        where = " WHERE {} IN (%s)" % ",".join("?" * len(params))
+    rows = conn.execute(
+        "SELECT user_id, day, points FROM daily_summary" + where.format("user_id") + " ORDER BY user_id, day", params
+    ).fetchall()
+    stats = _build_stats([r[0] for r in conn.execute("SELECT id FROM users" + where.format("id"), params)],
+                         rows, today())
+    conn.execute("DELETE FROM user_stats" + where.format("user_id"), params)
+    for st in stats.values():
+        _save_stats(conn, st)
+    return len(stats)
+
+# ─────────────────────────────────────────────
+# واجهة التخزين
+# ─────────────────────────────────────────────
+_DUMMY_HASH = None
+
+def _token_hash(token): return hashlib.sha256(token.encode()).hexdigest()
+
+def _month_range(day):
+    """(أول يوم في الشهر، أول يوم في الشهر التالي) كأرقام أيام"""
+    d = date.fromordinal(day)
+    first = d.replace(day=1)
+    nxt = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return first.toordinal(), nxt.toordinal()
+
+class Backend(ABC):
+    """
+    واجهة التخزين: دوال البيانات العامة في آخر الوحدة تستدعي backend().<الدالة> نفسها.
+    لها تطبيقان: SQLiteBackend (الافتراضي) وMemoryBackend. المفاتيح أعداد صحيحة والأيام أرقام أيام،
+    وكل سجل يُرجع قاموساً مستقلاً. التطبيق يكتب الدوال المجردة (abstractmethod)، أما التحقق من
+    كلمات المرور والجلسات والرموز وذاكرة سجلات المستخدمين وعرض الإحصاءات فمشتركة هنا.
+    """
+
+    def __init__(self):
+        # token_hash -> (انتهاء الصلاحية بثواني unix، سجل المستخدم)
+        self._user_cache = {}
+
+    @abstractmethod
+    def init(self):
+        """تجهيز المخطط والمستخدم admin؛ تُستدعى مع كل إعادة تشغيل لـ app.py فيجب أن تكون رخيصة"""
+
+    def close(self):
+        """تحرير الموارد؛ backend() يستدعيها قبل استبدال الواجهة الحالية"""
+
+    # ── المستخدمون والمجموعات
+    @abstractmethod
+    def get_user_by_username(self, username):
+        """سجل المستخدم كاملاً (مع password_hash) أو None"""
+
+    @abstractmethod
+    def get_user_by_uid(self, uid):
+        """سجل المستخدم بمعرّفه الخارجي uid أو None"""
+
+    @abstractmethod
+    def _set_password_hash(self, user_id, password_hash):
+        ...
+
+    def get_user(self, username, password):
+        """
+        التحقق من كلمة المرور (مكلف عمداً). التجزئات القديمة أو بكلفة مختلفة عن PW_SCRYPT_N
+        تُستبدل بتجزئة جديدة عند نجاح الدخول. اسم مستخدم غير موجود يكلّف الزمن نفسه.
+        """
+        global _DUMMY_HASH
+        user = self.get_user_by_username(username)
+        if user is None:
+            _DUMMY_HASH = _DUMMY_HASH or hash_pw("")
+            verify_pw(password, _DUMMY_HASH)
+            return None
+        ok, stale = verify_pw(password, user["password_hash"])
+        if not ok:
+            return None
+        if stale:
+            self._set_password_hash(user["id"], hash_pw(password))
+        return user
+
+    @abstractmethod
+    def get_all_users(self):
+        """كل المستخدمين عدا الآدمن"""
+
+    @abstractmethod
+    def add_user(self, name, username, password, group_id=None):
+        """False إن كان اسم المستخدم مأخوذاً"""
+
+    @abstractmethod
+    def delete_user(self, user_id):
+        """حذف المستخدم وإنجازاته وملخصاته وإحصاءاته وجلساته ورموزه"""
+
+    @abstractmethod
+    def update_user_group(self, user_id, group_id):
+        ...
+
+    @abstractmethod
+    def get_groups(self):
+        ...
+
+    @abstractmethod
+    def add_group(self, name):
+        ...
+
+    @abstractmethod
+    def delete_group(self, group_id):
+        """حذف المجموعة ومهامها (كما في delete_task) في معاملة واحدة؛ أعضاؤها يبقون بلا مجموعة"""
+
+    # ── المهام
+    @abstractmethod
+    def get_tasks(self, user_id=None, day=None):
+        """
+        بدون معاملات: كل المهام (لإدارتها). مع user_id أو day: المهام المستحقة في اليوم
+        (الافتراضي اليوم)، مقصورة على مهام المستخدم إن حُدد: المُعيَّنة له + لمجموعته + للجميع.
+        """
+
+    @abstractmethod
+    def add_task(self, title, assigned_to, task_type, points, unit, points_per_unit, target_units,
+                 recur="daily", weekdays=127, interval_days=1, start_day=None, end_day=None, group_id=None):
+        """
+        assigned_to: معرّف المستخدم أو "all" / None للجميع، أو group_id لتعيينها لمجموعة.
+        start_day/end_day أرقام أيام
+        """
+
+    @abstractmethod
+    def update_task_schedule(self, task_id, recur="daily", weekdays=127, interval_days=1, start_day=None,
+                             end_day=None):
+        """start_day=None يُبقي يوم البداية الحالي"""
+
+    @abstractmethod
+    def delete_task(self, task_id):
+        """حذف المهمة وإنجازاتها الحية، وإعادة بناء user_stats لمن أنجزها في المعاملة نفسها"""
+
+    # ── الإنجازات
+    @abstractmethod
+    def get_completions(self, user_id=None, day=None):
+        """الإنجازات الحية (غير المؤرشفة)، مصفّاة بالمستخدم و/أو اليوم"""
+
+    @abstractmethod
+    def get_daily_points(self, days, user_id=None):
+        """مجموع النقاط لكل يوم من days (من ملخص الأيام، حية ومؤرشفة)"""
+
+    @abstractmethod
+    def complete_check(self, user_id, task_id, points):
+        """تسجيل مهمة check اليوم؛ لا يتغير شيء إن كانت مسجلة"""
+
+    @abstractmethod
+    def undo_task(self, user_id, task_id):
+        ...
+
+    @abstractmethod
+    def complete_numeric(self, user_id, task_id, units, pts):
+        """تسجيل مهمة كمية اليوم أو استبدال تسجيلها"""
+
+    @abstractmethod
+    def submit_completions(self, items, day=None):
+        """
+        تسجيل دفعة إنجازات في معاملة واحدة بنفس منطق complete_check / complete_numeric.
+        items: [{"user_id", "task_id", "units"}] بمفاتيح داخلية، units للمهام الكمية فقط.
+        تُرجع حالة لكل عنصر: done | exists | recorded | error.
+        """
+
+    @abstractmethod
+    def import_completions(self, rows):
+        """
+        إدخال صفوف (user_id, task_id, day, units, points) كما هي، والموجود منها يُتجاهل، دون تحقق
+        ودون تحديث user_stats (البيانات التجريبية؛ يتبعها rebuild_user_stats). تُرجع عدد المُدخل.
+        """
+
+    def archive_completions(self, older_than_days=None, vacuum=False):
+        """
+        نقل الإنجازات الأقدم من older_than_days يوماً إلى الأرشيف (جدول لكل شهر) ثم حذفها من
+        الإنجازات الحية؛ مجاميعها باقية في ملخص الأيام. تُرجع قاموساً بعدد الصفوف والبايتات المنقولة.
+        """
+        days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        if days < 1:
+            raise ValueError("older_than_days must be >= 1")
+        cutoff = today() - days
+        report = {"cutoff": day_iso(cutoff), "rows": 0, "months": [], "archive_bytes": 0, "freed_bytes": 0}
+        self._archive_before(cutoff, report, vacuum)
+        return report
+
+    @abstractmethod
+    def _archive_before(self, cutoff, report, vacuum):
+        ...
+
+    # ── الإحصاءات والتجميعات
+    @abstractmethod
+    def _stats_row(self, user_id):
+        """صف user_stats للمستخدم (انظر _fold_day) أو None"""
+
+    def get_user_stats(self, user_id):
+        """السلسلة الحالية وأطول سلسلة ومجموع النقاط وأفضل يوم، من صف واحد دون مسح السجل"""
+        t = today()
+        st = self._stats_row(user_id) or _new_stats(user_id, t)
+        if st["day"] < t:
+            _fold_day(st)
+            st["day"] = t
+        base_alive = st["base_last_day"] is not None and st["base_last_day"] >= t - 1
+        streak = st["base_streak"] if base_alive else 0
+        if st["day_points"] > 0:
+            streak = st["base_streak"] + 1 if st["base_last_day"] == t - 1 else 1
+        best_points, best_day = st["base_best_points"], st["base_best_day"]
+        if st["day_points"] > best_points:
+            best_points, best_day = st["day_points"], t
+        return {
+            "current_streak": streak,
+            "longest_streak": max(st["base_longest"], streak),
+            "lifetime_points": st["base_lifetime"] + st["day_points"],
+            "best_day_points": best_points,
+            "best_day": best_day,
+        }
+
+    @abstractmethod
+    def rebuild_user_stats(self):
+        """إعادة بناء user_stats بالكامل من ملخص الأيام؛ تُرجع عدد المستخدمين"""
+
+    @abstractmethod
+    def get_leaderboard(self, day=None):
+        """المستخدمون (عدا الآدمن) مع pts وpct لليوم، مرتبين تنازلياً بالنقاط"""
+
+    @abstractmethod
+    def get_ids_by_uid(self, table, uids):
+        """{uid: id} للمعرّفات الخارجية الموجودة فقط؛ table: users | tasks | groups_"""
+
+    @abstractmethod
+    def search(self, query, limit=20):
+        """
+        بحث موحّد بالبادئة في المهام والمستخدمين والمجموعات، العنوان أثقل من التفاصيل.
+        تُرجع [{"kind", "id", "title", "detail", "score"}] بالنصوص الأصلية، الأعلى score أولاً.
+        """
+
+    @abstractmethod
+    def get_data_version(self):
+        """
+        مفتاح ذاكرة التحليلات: يزداد مع أي تغيير في ملخصات الأيام السابقة.
+        إنجازات اليوم لا تغيّره لأن عمود اليوم يُقرأ دائماً مباشرة.
+        """
+
+    @abstractmethod
+    def get_activity(self, first, last):
+        """
+        تجميعات التحليلات للأيام [first, last] كصفوف tuple، من الملخصات فقط:
+        points: (user_id، أول يوم في الأسبوع، نقاط الاثنين .. الأحد) لكل أسبوع يتقاطع مع المدى،
+                فالأيام خارج [first, last] على المستدعي أن يتجاهلها
+        tasks:  (task_id, day, done)
+        """
+
+    # ── الجلسات ورموز واجهة JSON
+    def _forget_user(self, user_id):
+        for key, (_, user) in list(self._user_cache.items()):
+            if user["id"] == user_id:
+                self._user_cache.pop(key, None)
+
+    def _cached_user(self, token, lookup):
+        """
+        سجل المستخدم لرمز جلسة أو رمز API، من الذاكرة إن لم تنقضِ USER_CACHE_TTL.
+        التعديلات في هذه العملية تُبطل السجل فوراً، وفي العمليات الأخرى خلال USER_CACHE_TTL على الأكثر.
+        lookup(token_hash) -> (سجل المستخدم، انتهاء الصلاحية أو None) أو None
+        """
+        if not token:
+            return None
+        key, now = _token_hash(token), time.time()
+        hit = self._user_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+        found = lookup(key)
+        if found is None:
+            self._user_cache.pop(key, None)
+            return None
+        user, expires = found
+        self._user_cache[key] = (min(now + USER_CACHE_TTL, expires or now + USER_CACHE_TTL), user)
+        return user
+
+    def create_session(self, user_id):
+        token = secrets.token_urlsafe(32)
+        self._store_session(_token_hash(token), user_id, int(time.time()) + SESSION_TTL_HOURS * 3600)
+        return token
+
+    def get_session_user(self, token):
+        return self._cached_user(token, self._session_user)
+
+    def end_session(self, token):
+        if not token:
+            return
+        key = _token_hash(token)
+        self._user_cache.pop(key, None)
+        self._drop_session(key)
+
+    def create_api_token(self, user_id, label=""):
+        """إنشاء رمز وصول جديد؛ يُعاد الرمز نفسه مرة واحدة فقط ولا يُخزَّن إلا مُجزّأً"""
+        token = secrets.token_urlsafe(32)
+        self._store_api_token(_token_hash(token), user_id, label)
+        return token
+
+    def get_token_user(self, token):
+        # رموز API لا تنتهي صلاحيتها؛ بقاؤها في الذاكرة تحكمه USER_CACHE_TTL وحدها
+        return self._cached_user(token, self._token_user)
+
+    def revoke_api_tokens(self, user_id):
+        """إلغاء كل رموز المستخدم؛ تُرجع عدد الرموز الملغاة"""
+        n = self._drop_api_tokens(user_id)
+        self._forget_user(user_id)
+        return n
+
+    @abstractmethod
+    def _store_session(self, key, user_id, expires):
+        """حفظ الجلسة وحذف المنتهية"""
+
+    @abstractmethod
+    def _session_user(self, key):
+        ...
+
+    @abstractmethod
+    def _drop_session(self, key):
+        ...
+
+    @abstractmethod
+    def _store_api_token(self, key, user_id, label):
+        ...
+
+    @abstractmethod
+    def _token_user(self, key):
+        ...
+
+    @abstractmethod
+    def _drop_api_tokens(self, user_id):
+        ...
+
+# ─────────────────────────────────────────────
+# SQLite
+# ─────────────────────────────────────────────
+# INSERT OR REPLACE لا يشغّل مشغل الحذف فيُحسب الإنجاز مرتين في الملخص (انظر SUMMARY_TRIGGERS)
+_UPSERT_COMPLETION = (
+    "INSERT INTO completions (user_id,task_id,day,units,points) VALUES (?,?,?,?,?) "
+    "ON CONFLICT(user_id, day, task_id) DO UPDATE SET units=excluded.units, points=excluded.points"
+)
+
+def _delete_tasks(conn, task_ids):
+    """حذف المهام وإنجازاتها الحية واستحقاقها وملخصها، داخل معاملة المستدعي"""
+    # حذف إنجازات الأيام السابقة يغيّر السلاسل والمجاميع، لا نقاط اليوم المفتوح وحدها
+    users = set()
+    for task_id in task_ids:
+        users.update(r[0] for r in conn.execute("SELECT DISTINCT user_id FROM completions WHERE task_id=?", (task_id,)))
+        conn.execute("DELETE FROM tasks WHERE id=?", (task_id,))
+        conn.execute("DELETE FROM completions WHERE task_id=?", (task_id,))
+        conn.execute("DELETE FROM task_due WHERE task_id=?", (task_id,))
+        conn.execute("DELETE FROM task_daily_summary WHERE task_id=?", (task_id,))
+    if users:
+        _rebuild_user_stats(conn, users)
+
+def _db_bytes(conn, schema="main"):
+    page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+    pages     = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+    free      = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+    return (pages - free) * page_size
+
+class SQLiteBackend(Backend):
+    """
+    ملف SQLite على القرص. لكل خيط اتصال واحد يُفتح مرة ويُعاد استخدامه (فتح اتصال وقراءة المخطط
+    كانا يكلّفان ~0.7ms في كل استدعاء)، والاستدعاء المتداخل في الخيط نفسه يأخذ اتصالاً مؤقتاً مستقلاً.
+    اتصالات الخيوط مسجلة في _conns: اتصال الخيط المنتهي يُغلق عند فتح اتصال جديد (Streamlit يشغّل كل
+    إعادة تشغيل في خيط جديد)، وclose() يغلقها كلها.
+    """
+
+    def __init__(self, path, archive_path):
+        super().__init__()
+        self.path = path
+        self.archive_path = archive_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = {}  # الخيط -> اتصاله الدائم (sqlite3.Connection لا تقبل weakref)
+        self._due_until = None  # آخر يوم محسوب في task_due (نسخة محلية لتجنب قراءة meta في كل طلب)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-32000")     # 32MB بدل 2MB الافتراضية
+        conn.execute("PRAGMA temp_store=MEMORY")     # فرز GROUP BY في التحليلات بدون ملفات مؤقتة
+        conn.execute("PRAGMA mmap_size=268435456")   # 256MB قراءة مباشرة من ذاكرة النظام
+        return conn
+
+    def _thread_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+            with self._lock:
+                for th in [th for th in self._conns if not th.is_alive()]:
+                    self._conns.pop(th).close()
+                self._conns[threading.current_thread()] = conn
+        return conn
+
+    def acquire(self):
+        """(اتصال، هل هو اتصال الخيط الدائم)"""
+        local = self._local
+        if getattr(local, "busy", False):
+            conn, pooled = self._open(), False
+        else:
+            conn, pooled = self._thread_conn(), True
+            local.busy = True
+        conn.row_factory = sqlite3.Row
+        return conn, pooled
+
+    def release(self, conn, pooled):
+        if pooled:
+            self._local.busy = False
+        else:
+            conn.close()
+
+    def close(self):
+        """إغلاق اتصالات كل الخيوط؛ استعلام جارٍ في خيط آخر يفشل بـ ProgrammingError"""
+        with self._lock:
+            conns, self._conns = list(self._conns.values()), {}
+            self._local = threading.local()
+        for conn in conns:
+            conn.close()
+
+    @contextmanager
+    def connect(self):
+        """اتصال داخل معاملة: commit عند النجاح وrollback عند أي استثناء"""
+        conn, pooled = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn, pooled)
+
+    def init(self):
+        """
+        إن كان المخطط بالإصدار الحالي فهي قراءات فقط
+        (أي كتابة هنا تُنمي ملف WAL وتغيّر data_version للاتصالات الأخرى في كل مرة).
+        """
+        with self.connect() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(f"database schema v{version} is newer than this code (v{SCHEMA_VERSION})")
+            if version < SCHEMA_VERSION:
+                # WAL: القراءات لا تنتظر الكتابات (الواجهة وapi.py يعملان على الملف نفسه)
+                conn.execute("PRAGMA journal_mode=WAL")
+                legacy = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'"
+                ).fetchone()
+                if legacy and version == 0:
+                    version = 1
+                if legacy:
+                    for v in range(version, SCHEMA_VERSION):
+                        MIGRATIONS[v](conn, self.archive_path)
+                # أي إضافة إلى SCHEMA تحتاج رفع SCHEMA_VERSION حتى تصل إلى القواعد الموجودة
+                conn.executescript(SCHEMA)
+                conn.executescript(SUMMARY_TRIGGERS)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._extend_due_index(conn)
+            exists = conn.execute("SELECT id FROM users WHERE username='admin'").fetchone()
+            if not exists:
+                conn.execute(
+                    "INSERT INTO users (uid, username, password_hash, name, role, search_title, search_detail)"
+                    " VALUES (?,?,?,?,?,?,?)",
+                    (gen_id(), "admin", hash_pw("admin123"), "المدير", "admin", ar_index("المدير"), "admin")
+                )
+
+    # ── فهرس المهام المستحقة
+    def _extend_due_index(self, conn):
+        """مدّ task_due حتى اليوم + DUE_HORIZON_DAYS (يُستدعى مرة كل بضعة أسابيع فعلياً)"""
+        t = today()
+        if self._due_until is not None and self._due_until >= t + DUE_HORIZON_DAYS // 2:
+            return
+        row = conn.execute("SELECT value FROM meta WHERE key='due_until'").fetchone()
+        until = row[0] if row else t - 1
+        if until < t + DUE_HORIZON_DAYS // 2:
+            first, last = max(until + 1, t), t + DUE_HORIZON_DAYS
+            tasks = conn.execute("SELECT * FROM tasks").fetchall()
+            _materialize_due(conn, tasks, first, last)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('due_until', ?)", (last,))
+            conn.commit()
+            until = last
+        self._due_until = until
+
+    def _refresh_task_due(self, conn, task_id):
+        """إعادة حساب أيام استحقاق مهمة واحدة من اليوم فصاعداً (الأيام الماضية تبقى كما كانت)"""
+        self._extend_due_index(conn)
+        t = today()
+        conn.execute("DELETE FROM task_due WHERE task_id=? AND day >= ?", (task_id, t))
+        task = conn.execute("SELECT * FROM tasks WHERE id=?", (task_id,)).fetchone()
+        if task:
+            _materialize_due(conn, [task], t, self._due_until)
+
+    # ── المستخدمون والمجموعات
+    def get_user_by_username(self, username):
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
+        return dict(row) if row else None
+
+    def get_user_by_uid(self, uid):
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM users WHERE uid=?", (uid,)).fetchone()
+        return dict(row) if row else None
+
+    def _set_password_hash(self, user_id, password_hash):
+        with self.connect() as conn:
+            conn.execute("UPDATE users SET password_hash=? WHERE id=?", (password_hash, user_id))
+
+    def get_all_users(self):
+        with self.connect() as conn:
+            return [dict(r) for r in conn.execute("SELECT * FROM users WHERE role != 'admin'").fetchall()]
+
+    def add_user(self, name, username, password, group_id=None):
+        with self.connect() as conn:
+            try:
+                conn.execute(
+                    "INSERT INTO users (uid,username,password_hash,name,role,group_id,search_title,search_detail)"
+                    " VALUES (?,?,?,?,?,?,?,?)",
+                    (gen_id(), username, hash_pw(password), name, "user", group_id or None,
+                     ar_index(name), ar_index(username))
+                )
+                return True
+            except sqlite3.IntegrityError:
+                return False
+
+    def delete_user(self, user_id):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM users WHERE id=?", (user_id,))
+            conn.execute("DELETE FROM completions WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM daily_summary WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM weekly_points WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM api_tokens WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM sessions WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM user_stats WHERE user_id=?", (user_id,))
+        self._forget_user(user_id)
+
+    def update_user_group(self, user_id, group_id):
+        with self.connect() as conn:
+            conn.execute("UPDATE users SET group_id=? WHERE id=?", (group_id or None, user_id))
+        self._forget_user(user_id)
+
+    def get_groups(self):
+        with self.connect() as conn:
+            return [dict(r) for r in conn.execute("SELECT * FROM groups_").fetchall()]
+
+    def add_group(self, name):
+        with self.connect() as conn:
+            conn.execute("INSERT INTO groups_ (uid,name,search_title) VALUES (?,?,?)",
+                         (gen_id(), name, ar_index(name)))
+
+    def delete_group(self, group_id):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM groups_ WHERE id=?", (group_id,))
+            conn.execute("UPDATE users SET group_id=NULL WHERE group_id=?", (group_id,))
+            _delete_tasks(conn, [r[0] for r in conn.execute("SELECT id FROM tasks WHERE group_id=?", (group_id,))])
+        self._user_cache.clear()
+
+    # ── المهام
+    def get_tasks(self, user_id=None, day=None):
+        # من فهرس task_due، ومهام المستخدم كل منها عبر فهرس على tasks
+        with self.connect() as conn:
+            if user_id:
+                self._extend_due_index(conn)
+                rows = conn.execute("""
+                    SELECT t.* FROM tasks t JOIN task_due d ON d.day = ? AND d.task_id = t.id
+                    WHERE t.id IN (
+                        SELECT id FROM tasks WHERE assigned_to = ?
+                        UNION ALL
+                        SELECT id FROM tasks WHERE group_id = (SELECT group_id FROM users WHERE id = ?)
+                        UNION ALL
+                        SELECT id FROM tasks WHERE assigned_to IS NULL AND group_id IS NULL
+                    )
+                """, (day or today(), user_id, user_id)).fetchall()
+            elif day:
+                self._extend_due_index(conn)
+                rows = conn.execute(
+                    "SELECT t.* FROM task_due d JOIN tasks t ON t.id = d.task_id WHERE d.day=?", (day,)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM tasks").fetchall()
+            return [dict(r) for r in rows]
+
+    def add_task(self, title, assigned_to, task_type, points, unit, points_per_unit, target_units,
+                 recur="daily", weekdays=127, interval_days=1, start_day=None, end_day=None, group_id=None):
+        with self.connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO tasks (uid,title,assigned_to,group_id,task_type,points,unit,points_per_unit,target_units,"
+                "created_day,recur,weekdays,interval_days,start_day,end_day,search_title,search_detail)"
+                " VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                (gen_id(), title, None if assigned_to in (None, "all") or group_id else assigned_to, group_id or None,
+                 task_type, points, unit, points_per_unit, target_units, today(),
+                 recur, weekdays, interval_days, start_day or today(), end_day, ar_index(title), ar_index(unit))
+            )
+            self._refresh_task_due(conn, cur.lastrowid)
+
+    def update_task_schedule(self, task_id, recur="daily", weekdays=127, interval_days=1, start_day=None,
+                             end_day=None):
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET recur=?, weekdays=?, interval_days=?, start_day=COALESCE(?, start_day), end_day=?"
+                " WHERE id=?",
+                (recur, weekdays, interval_days, start_day, end_day, task_id)
+            )
+            self._refresh_task_due(conn, task_id)
+
+    def delete_task(self, task_id):
+        with self.connect() as conn:
+            _delete_tasks(conn, [task_id])
+
+    # ── الإنجازات
+    def get_completions(self, user_id=None, day=None):
+        with self.connect() as conn:
+            q, params = "SELECT * FROM completions WHERE 1=1", []
+            if user_id: q += " AND user_id=?"; params.append(user_id)
+            if day:     q += " AND day=?";     params.append(day)
+            return [dict(r) for r in conn.execute(q, params).fetchall()]
+
+    def get_daily_points(self, days, user_id=None):
+        totals = {d: 0.0 for d in days}
+        if not days:
+            return totals
+        with self.connect() as conn:
+            q = "SELECT day, SUM(points) AS pts FROM daily_summary WHERE day BETWEEN ? AND ? {u} GROUP BY day".format(
+                u="AND user_id=?" if user_id else "")
+            rng = [min(days), max(days)] + ([user_id] if user_id else [])
+            for r in conn.execute(q, rng).fetchall():
+                if r["day"] in totals:
+                    totals[r["day"]] = r["pts"] or 0.0
+        return totals
+
+    def complete_check(self, user_id, task_id, points):
+        with self.connect() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO completions (user_id,task_id,day,units,points) VALUES (?,?,?,?,?)",
+                (user_id, task_id, today(), 1, points)
+            )
+            if cur.rowcount:
+                _touch_user_stats(conn, user_id, today())
+
+    def undo_task(self, user_id, task_id):
+        with self.connect() as conn:
+            cur = conn.execute(
+                "DELETE FROM completions WHERE user_id=? AND task_id=? AND day=?",
+                (user_id, task_id, today())
+            )
+            if cur.rowcount:
+                _touch_user_stats(conn, user_id, today())
+
+    def complete_numeric(self, user_id, task_id, units, pts):
+        with self.connect() as conn:
+            conn.execute(_UPSERT_COMPLETION, (user_id, task_id, today(), units, pts))
+            _touch_user_stats(conn, user_id, today())
+
+    def submit_completions(self, items, day=None):
+        if not items:
+            return []
+        day = day or today()
+        results = [None] * len(items)
+        user_ids = list({it["user_id"] for it in items})
+        task_ids = list({it["task_id"] for it in items})
+        with self.connect() as conn:
+            self._extend_due_index(conn)
+            um, tm = ",".join("?" * len(user_ids)), ",".join("?" * len(task_ids))
+            groups = dict(conn.execute(f"SELECT id, group_id FROM users WHERE id IN ({um})", user_ids).fetchall())
+            tasks = {r["id"]: r for r in conn.execute(f"SELECT * FROM tasks WHERE id IN ({tm})", task_ids).fetchall()}
+            due = {r[0] for r in conn.execute(
+                f"SELECT task_id FROM task_due WHERE day=? AND task_id IN ({tm})", [day] + task_ids
+            ).fetchall()}
+            for i, it in enumerate(items):
+                task, uid = tasks.get(it["task_id"]), it["user_id"]
+                error = _item_error(it, task, groups, due)
+                if error:
+                    results[i] = {"status": "error", "error": error}
+                elif task["task_type"] == "check":
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO completions (user_id,task_id,day,units,points) VALUES (?,?,?,?,?)",
+                        (uid, task["id"], day, 1, task["points"])
+                    )
+                    results[i] = {"status": "done" if cur.rowcount else "exists"}
+                else:
+                    pts = it["units"] * task["points_per_unit"]
+                    conn.execute(_UPSERT_COMPLETION, (uid, task["id"], day, it["units"], pts))
+                    results[i] = {"status": "recorded", "points": pts}
+            for uid in {it["user_id"] for it, r in zip(items, results) if r["status"] in ("done", "recorded")}:
+                _touch_user_stats(conn, uid, day)
+        return results
+
+    def import_completions(self, rows):
+        with self.connect() as conn:
+            return conn.executemany(
+                "INSERT OR IGNORE INTO completions (user_id,task_id,day,units,points) VALUES (?,?,?,?,?)", rows
+            ).rowcount
+
+    def _archive_before(self, cutoff, report, vacuum):
+        # الأرشيف ملف SQLite منفصل بجداول archive.completions_YYYY_MM
+        with self.connect() as conn:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            try:
+                main_before    = _db_bytes(conn)
+                archive_before = _db_bytes(conn, "archive")
+                start = conn.execute("SELECT MIN(day) FROM completions").fetchone()[0]
+                while start is not None and start < cutoff:
+                    first, nxt = _month_range(start)
+                    month = date.fromordinal(first).strftime("%Y_%m")
+                    table = "completions_" + month
+                    conn.execute(ARCHIVE_TABLE.format(table=table))
+                    cur = conn.execute(f"""
+                        INSERT OR REPLACE INTO archive.{table} (user_id,task_id,day,units,points)
+                        SELECT user_id,task_id,day,units,points FROM completions
+                        WHERE day >= ? AND day < ?
+                    """, (first, min(nxt, cutoff)))
+                    report["rows"] += cur.rowcount
+                    report["months"].append(month.replace("_", "-"))
+                    start = conn.execute("SELECT MIN(day) FROM completions WHERE day >= ?", (nxt,)).fetchone()[0]
+
+                # الملخصان يحويان هذه الأيام أصلاً، فالحذف هنا لا يُنقصهما (انظر SUMMARY_TRIGGERS)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('archiving', 1)")
+                conn.execute("DELETE FROM completions WHERE day < ?", (cutoff,))
+                conn.execute("DELETE FROM meta WHERE key = 'archiving'")
+                conn.execute("DELETE FROM task_due WHERE day < ?", (cutoff,))
+                conn.commit()
+
+                report["archive_bytes"] = _db_bytes(conn, "archive") - archive_before
+                report["freed_bytes"]   = main_before - _db_bytes(conn)
+            finally:
+                conn.rollback()
+                conn.execute("DETACH DATABASE archive")
+
+            if vacuum and report["rows"]:
+                conn.execute("VACUUM")
+
+    # ── الإحصاءات والتجميعات
+    def _stats_row(self, user_id):
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM user_stats WHERE user_id=?", (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def rebuild_user_stats(self):
+        with self.connect() as conn:
+            return _rebuild_user_stats(conn)
+
+    def get_leaderboard(self, day=None):
+        # استعلامات تجميعية ثابتة العدد بدل compute_user_stats لكل مستخدم:
+        # الحد الأقصى لكل مستخدم = مهام الجميع + مهام مجموعته + مهامه الخاصة المستحقة في اليوم
+        day = day or today()
+        with self.connect() as conn:
+            self._extend_due_index(conn)
+            users = [dict(r) for r in conn.execute("SELECT * FROM users WHERE role != 'admin'").fetchall()]
+            pts = dict(conn.execute(
+                "SELECT user_id, SUM(points) FROM completions WHERE day=? GROUP BY user_id", (day,)
+            ).fetchall())
+            max_all, max_group, max_user = 0.0, {}, {}
+            for r in conn.execute("""
+                SELECT t.assigned_to, t.group_id,
+                       SUM(CASE WHEN t.task_type='check' THEN t.points ELSE t.points_per_unit * t.target_units END)
+                FROM task_due d JOIN tasks t ON t.id = d.task_id
+                WHERE d.day=? GROUP BY t.assigned_to, t.group_id
+            """, (day,)).fetchall():
+                if r[1] is not None:
+                    max_group[r[1]] = max_group.get(r[1], 0.0) + r[2]
+                elif r[0] is not None:
+                    max_user[r[0]] = r[2]
+                else:
+                    max_all = r[2]
+        return _rank(users, pts, max_all, max_group, max_user)
+
+    def get_ids_by_uid(self, table, uids):
+        if table not in ("users", "tasks", "groups_") or not uids:
+            return {}
+        uids = list(set(uids))
+        with self.connect() as conn:
+            marks = ",".join("?" * len(uids))
+            return dict(conn.execute(f"SELECT uid, id FROM {table} WHERE uid IN ({marks})", uids).fetchall())
+
+    def search(self, query, limit=20):
+        # search_index (FTS5) مرتب بـ bm25: العنوان 10 والتفاصيل 2
+        tokens = [tok.replace('"', "") for tok in ar_norm(query).split()]
+        tokens = [tok for tok in tokens if tok]
+        if not tokens:
+            return []
+        match = " ".join(f'"{tok}"*' for tok in tokens)
+        with self.connect() as conn:
+            hits = conn.execute(
+                "SELECT kind, ref, bm25(search_index, 0, 0, 10.0, 2.0) AS score FROM search_index "
+                "WHERE search_index MATCH ? ORDER BY score LIMIT ?", (match, limit)
+            ).fetchall()
+            by_kind = {}
+            for h in hits:
+                by_kind.setdefault(h["kind"], []).append(h["ref"])
+            sources = {
+                "task":  "SELECT id, title, unit AS detail FROM tasks WHERE id IN ({})",
+                "user":  "SELECT id, name AS title, '@' || username AS detail FROM users WHERE id IN ({})",
+                "group": "SELECT id, name AS title, '' AS detail FROM groups_ WHERE id IN ({})",
+            }
+            rows = {}
+            for kind, ids in by_kind.items():
+                q = sources[kind].format(",".join("?" * len(ids)))
+                rows.update({(kind, r["id"]): r for r in conn.execute(q, ids).fetchall()})
+        return [
+            {"kind": h["kind"], "id": h["ref"], "title": rows[(h["kind"], h["ref"])]["title"],
+             "detail": rows[(h["kind"], h["ref"])]["detail"], "score": -h["score"]}
+            for h in hits if (h["kind"], h["ref"]) in rows
+        ]
+
+    def get_data_version(self):
+        with self.connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key='data_version'").fetchone()[0]
+
+    def get_activity(self, first, last):
+        # صفوف tuple بدون sqlite3.Row لسرعة الجلب؛ points من weekly_points وtasks من task_daily_summary
+        with self.connect() as conn:
+            conn.row_factory = None
+            # لمدى طويل: +week يُبطل فهرس week فيُمسح الجدول بترتيب مفتاحه، أسرع بكثير من قفزات الفهرس.
+            # لأسابيع قليلة (عمود اليوم مثلاً) يبقى الفهرس أفضل.
+            week = "+week" if last - first > 14 else "week"
+            points = conn.execute(
+                f"SELECT user_id, week * 7 + 1, {_WEEK_COLS} FROM weekly_points WHERE {week} BETWEEN ? AND ?",
+                ((first - 1) // 7, (last - 1) // 7)
+            ).fetchall()
+            tasks = conn.execute(
+                "SELECT task_id, day, done FROM task_daily_summary WHERE day BETWEEN ? AND ?", (first, last)
+            ).fetchall()
+        return {"points": points, "tasks": tasks}
+
+    # ── الجلسات ورموز واجهة JSON
+    def _store_session(self, key, user_id, expires):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE expires <= ?", (int(time.time()),))
+            conn.execute("INSERT INTO sessions (token_hash, user_id, expires) VALUES (?,?,?)",
+                         (key, user_id, expires))
+
+    def _session_user(self, key):
+        with self.connect() as conn:
+            row = conn.execute("""
+                SELECT u.*, s.expires AS _expires FROM sessions s JOIN users u ON u.id = s.user_id
+                WHERE s.token_hash = ? AND s.expires > CAST(strftime('%s', 'now') AS INTEGER)
+            """, (key,)).fetchone()
+        if row is None:
+            return None
+        user = dict(row)
+        return user, user.pop("_expires")
+
+    def _drop_session(self, key):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE token_hash=?", (key,))
+
+    def _store_api_token(self, key, user_id, label):
+        with self.connect() as conn:
+            conn.execute("INSERT INTO api_tokens (token_hash, user_id, label, created_day) VALUES (?,?,?,?)",
+                         (key, user_id, label, today()))
+
+    def _token_user(self, key):
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT u.* FROM api_tokens a JOIN users u ON u.id = a.user_id WHERE a.token_hash = ?", (key,)
+            ).fetchone()
+        return (dict(row), None) if row else None
+
+    def _drop_api_tokens(self, user_id):
+        with self.connect() as conn:
+            return conn.execute("DELETE FROM api_tokens WHERE user_id=?", (user_id,)).rowcount
+
+def _rank(users, pts, max_all, max_group, max_user):
+    """لوحة الشرف من نقاط اليوم {user_id: pts} والحد الأقصى للجميع ولكل مجموعة ولكل مستخدم"""
+    lb = []
+    for u in users:
+        p = pts.get(u["id"], 0.0)
+        mx = max_all + max_group.get(u["group_id"], 0.0) + max_user.get(u["id"], 0.0)
+        lb.append({**u, "pts": p, "pct": int(p / mx * 100) if mx > 0 else 0})
+    return sorted(lb, key=lambda x: x["pts"], reverse=True)
+
+# ─────────────────────────────────────────────
+# الذاكرة
+# ─────────────────────────────────────────────
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _words(text):
+    """كلمات نص مطبَّع كما يقطّعها unicode61 تقريباً"""
+    return re.findall(r"\w+", text)
+
+class MemoryBackend(Backend):
+    """
+    قواميس Python في ذاكرة العملية للاختبارات وقياس الأداء، دون SQL ولا ملفات: الملخصات ورقم
+    data_version تُحدَّث في _put/_pop كما تفعل مشغلات SQLite، والاستحقاق يُحسب بـ is_due مباشرة.
+    قفل واحد يحمي كل دالة عامة. المسارات تُتجاهل، والبيانات تذهب مع الكائن (أي تغيير في DB يبدأ فارغاً).
+    """
+
+    def __init__(self, path=None, archive_path=None):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._ids = {table: itertools.count(1) for table in ("users", "groups_", "tasks")}
+        self._users, self._groups, self._tasks = {}, {}, {}
+        self._completions = {}   # (user_id, day) -> {task_id: سجل الإنجاز}
+        self._daily = {}         # (user_id, day) -> [points, done]، حية ومؤرشفة مثل daily_summary
+        self._task_daily = {}    # (task_id, day) -> [points, done]
+        self._stats = {}         # user_id -> صف user_stats
+        self._search = {}        # (kind, id) -> (كلمات العنوان، كلمات التفاصيل)
+        self._sessions = {}      # token_hash -> (user_id, expires)
+        self._api_tokens = {}    # token_hash -> (user_id, label, created_day)
+        self._archive = {}       # "YYYY_MM" -> {(user_id, day, task_id): سجل الإنجاز}
+        self._version = 0
+
+    @_locked
+    def init(self):
+        if self.get_user_by_username("admin") is None:
+            self._insert_user("المدير", "admin", hash_pw("admin123"), "admin", None)
+
+    # ── الإنجازات والملخصات
+    def _summarize(self, row, sign):
+        for table, key in ((self._daily, (row["user_id"], row["day"])),
+                           (self._task_daily, (row["task_id"], row["day"]))):
+            cell = table.setdefault(key, [0.0, 0])
+            cell[0] += sign * row["points"]
+            cell[1] += sign
+            if cell[1] <= 0:
+                del table[key]
+        if row["day"] < today():
+            self._version += 1
+
+    def _put(self, user_id, task_id, day, units, points):
+        """إدخال إنجاز أو استبداله مع تحديث الملخصين"""
+        bucket = self._completions.setdefault((user_id, day), {})
+        old = bucket.get(task_id)
+        if old:
+            self._summarize(old, -1)
+        bucket[task_id] = row = {"user_id": user_id, "task_id": task_id, "day": day,
+                                 "units": float(units), "points": float(points)}
+        self._summarize(row, 1)
+
+    def _pop(self, user_id, day, task_id, summarize=True):
+        bucket = self._completions.get((user_id, day))
+        row = bucket.pop(task_id, None) if bucket else None
+        if bucket is not None and not bucket:
+            del self._completions[(user_id, day)]
+        if row and summarize:
+            self._summarize(row, -1)
+        return row
+
+    def _touch_stats(self, user_id, day):
+        # مثل _touch_user_stats
+        st = self._stats.get(user_id) or _new_stats(user_id, day)
+        if day < st["day"]:
+            return
+        if day > st["day"]:
+            _fold_day(st)
+            st["day"] = day
+        st["day_points"] = sum(c["points"] for c in self._completions.get((user_id, day), {}).values())
+        self._stats[user_id] = st
+
+    # ── المستخدمون والمجموعات
+    def _insert_user(self, name, username, password_hash, role, group_id):
+        uid = next(self._ids["users"])
+        self._users[uid] = {"id": uid, "uid": gen_id(), "username": username, "password_hash": password_hash,
+                            "name": name, "role": role, "group_id": group_id}
+        self._search[("user", uid)] = (_words(ar_index(name)), _words(ar_index(username)))
+
+    @_locked
+    def get_user_by_username(self, username):
+        return next((dict(u) for u in self._users.values() if u["username"] == username), None)
+
+    @_locked
+    def get_user_by_uid(self, uid):
+        return next((dict(u) for u in self._users.values() if u["uid"] == uid), None)
+
+    @_locked
+    def _set_password_hash(self, user_id, password_hash):
+        if user_id in self._users:
+            self._users[user_id]["password_hash"] = password_hash
+
+    @_locked
+    def get_all_users(self):
+        return [dict(u) for u in self._users.values() if u["role"] != "admin"]
+
+    @_locked
+    def add_user(self, name, username, password, group_id=None):
+        if any(u["username"] == username for u in self._users.values()):
+            return False
+        self._insert_user(name, username, hash_pw(password), "user", group_id or None)
+        return True
+
+    @_locked
+    def delete_user(self, user_id):
+        self._users.pop(user_id, None)
+        self._search.pop(("user", user_id), None)
+        for (uid, day) in [k for k in self._completions if k[0] == user_id]:
+            for task_id in list(self._completions[(uid, day)]):
+                self._pop(uid, day, task_id)
+        for key in [k for k in self._daily if k[0] == user_id]:
+            del self._daily[key]
+            self._version += 1
+        self._stats.pop(user_id, None)
+        self._sessions = {k: s for k, s in self._sessions.items() if s[0] != user_id}
+        self._api_tokens = {k: a for k, a in self._api_tokens.items() if a[0] != user_id}
+        self._forget_user(user_id)
+
+    @_locked
+    def update_user_group(self, user_id, group_id):
+        if user_id in self._users:
+            self._users[user_id]["group_id"] = group_id or None
+        self._forget_user(user_id)
+
+    @_locked
+    def get_groups(self):
+        return [dict(g) for g in self._groups.values()]
+
+    @_locked
+    def add_group(self, name):
+        gid = next(self._ids["groups_"])
+        self._groups[gid] = {"id": gid, "uid": gen_id(), "name": name}
+        self._search[("group", gid)] = (_words(ar_index(name)), [])
+
+    @_locked
+    def delete_group(self, group_id):
+        self._groups.pop(group_id, None)
+        self._search.pop(("group", group_id), None)
+        for u in self._users.values():
+            if u["group_id"] == group_id:
+                u["group_id"] = None
+        self._delete_tasks([tid for tid, t in self._tasks.items() if t["group_id"] == group_id])
+        self._user_cache.clear()
+
+    # ── المهام
+    @_locked
+    def get_tasks(self, user_id=None, day=None):
+        if user_id:
+            day = day or today()
+            gid = self._users[user_id]["group_id"] if user_id in self._users else None
+            rows = [t for t in self._tasks.values() if is_assigned(t, user_id, gid) and is_due(t, day)]
+        elif day:
+            rows = [t for t in self._tasks.values() if is_due(t, day)]
+        else:
+            rows = self._tasks.values()
+        return [dict(t) for t in rows]
+
+    @_locked
+    def add_task(self, title, assigned_to, task_type, points, unit, points_per_unit, target_units,
+                 recur="daily", weekdays=127, interval_days=1, start_day=None, end_day=None, group_id=None):
+        tid = next(self._ids["tasks"])
+        self._tasks[tid] = {
+            "id": tid, "uid": gen_id(), "title": title,
+            "assigned_to": None if assigned_to in (None, "all") or group_id else assigned_to,
+            "task_type": task_type, "points": points, "unit": unit, "points_per_unit": points_per_unit,
+            "target_units": target_units, "created_day": today(), "recur": recur, "weekdays": weekdays,
+            "interval_days": interval_days, "start_day": start_day or today(), "end_day": end_day,
+            "group_id": group_id or None,
+        }
+        self._search[("task", tid)] = (_words(ar_index(title)), _words(ar_index(unit)))
+
+    @_locked
+    def update_task_schedule(self, task_id, recur="daily", weekdays=127, interval_days=1, start_day=None,
+                             end_day=None):
+        task = self._tasks.get(task_id)
+        if task:
+            task.update(recur=recur, weekdays=weekdays, interval_days=interval_days,
+                        start_day=start_day or task["start_day"], end_day=end_day)
+
+    @_locked
+    def delete_task(self, task_id):
+        self._delete_tasks([task_id])
+
+    def _delete_tasks(self, task_ids):
+        users = set()
+        for task_id in task_ids:
+            self._tasks.pop(task_id, None)
+            self._search.pop(("task", task_id), None)
+            keys = [k for k, bucket in self._completions.items() if task_id in bucket]
+            for (uid, day) in keys:
+                self._pop(uid, day, task_id)
+            for key in [k for k in self._task_daily if k[0] == task_id]:
+                del self._task_daily[key]
+            users.update(uid for uid, _ in keys)
+        if users:
+            self._rebuild_stats(users)
+
+    # ── الإنجازات
+    @_locked
+    def get_completions(self, user_id=None, day=None):
+        keys = [(user_id, day)] if user_id and day else sorted(
+            k for k in self._completions if (not user_id or k[0] == user_id) and (not day or k[1] == day))
+        return [dict(self._completions[k][tid]) for k in keys if k in self._completions
+                for tid in sorted(self._completions[k])]
+
+    @_locked
+    def get_daily_points(self, days, user_id=None):
+        totals = {d: 0.0 for d in days}
+        for (uid, day), (pts, _) in self._daily.items():
+            if day in totals and (not user_id or uid == user_id):
+                totals[day] += pts
+        return totals
+
+    @_locked
+    def complete_check(self, user_id, task_id, points):
+        t = today()
+        if task_id not in self._completions.get((user_id, t), {}):
+            self._put(user_id, task_id, t, 1, points)
+            self._touch_stats(user_id, t)
+
+    @_locked
+    def undo_task(self, user_id, task_id):
+        t = today()
+        if self._pop(user_id, t, task_id):
+            self._touch_stats(user_id, t)
+
+    @_locked
+    def complete_numeric(self, user_id, task_id, units, pts):
+        t = today()
+        self._put(user_id, task_id, t, units, pts)
+        self._touch_stats(user_id, t)
+
+    @_locked
+    def submit_completions(self, items, day=None):
+        if not items:
+            return []
+        day = day or today()
+        results = [None] * len(items)
+        groups = {u: self._users[u]["group_id"] for u in {it["user_id"] for it in items} if u in self._users}
+        tasks = {t: self._tasks[t] for t in {it["task_id"] for it in items} if t in self._tasks}
+        due = {tid for tid, task in tasks.items() if is_due(task, day)}
+        for i, it in enumerate(items):
+            task, uid = tasks.get(it["task_id"]), it["user_id"]
+            error = _item_error(it, task, groups, due)
+            if error:
+                results[i] = {"status": "error", "error": error}
+            elif task["task_type"] == "check":
+                if task["id"] in self._completions.get((uid, day), {}):
+                    results[i] = {"status": "exists"}
+                else:
+                    self._put(uid, task["id"], day, 1, task["points"])
+                    results[i] = {"status": "done"}
+            else:
+                pts = it["units"] * task["points_per_unit"]
+                self._put(uid, task["id"], day, it["units"], pts)
+                results[i] = {"status": "recorded", "points": pts}
+        for uid in {it["user_id"] for it, r in zip(items, results) if r["status"] in ("done", "recorded")}:
+            self._touch_stats(uid, day)
+        return results
+
+    @_locked
+    def import_completions(self, rows):
+        n = 0
+        for user_id, task_id, day, units, points in rows:
+            if task_id not in self._completions.get((user_id, day), {}):
+                self._put(user_id, task_id, day, units, points)
+                n += 1
+        return n
+
+    @_locked
+    def _archive_before(self, cutoff, report, vacuum):
+        months = set()
+        for (uid, day) in sorted(k for k in self._completions if k[1] < cutoff):
+            month = date.fromordinal(day).strftime("%Y_%m")
+            months.add(month)
+            for task_id in list(self._completions[(uid, day)]):
+                row = self._pop(uid, day, task_id, summarize=False)
+                self._archive.setdefault(month, {})[(uid, day, task_id)] = row
+                report["rows"] += 1
+        report["months"] = [m.replace("_", "-") for m in sorted(months)]
+
+    # ── الإحصاءات والتجميعات
+    @_locked
+    def _stats_row(self, user_id):
+        st = self._stats.get(user_id)
+        return dict(st) if st else None
+
+    def _rebuild_stats(self, user_ids=None):
+        # مثل _rebuild_user_stats
+        rows = sorted((uid, day, cell[0]) for (uid, day), cell in self._daily.items()
+                      if user_ids is None or uid in user_ids)
+        stats = _build_stats([uid for uid in self._users if user_ids is None or uid in user_ids], rows, today())
+        if user_ids is None:
+            self._stats = {}
+        for uid in user_ids or ():
+            self._stats.pop(uid, None)
+        self._stats.update(stats)
+        return len(stats)
+
+    @_locked
+    def rebuild_user_stats(self):
+        return self._rebuild_stats()
+
+    @_locked
+    def get_leaderboard(self, day=None):
+        day = day or today()
+        users = [dict(u) for u in self._users.values() if u["role"] != "admin"]
+        pts = {uid: sum(c["points"] for c in bucket.values())
+               for (uid, d), bucket in self._completions.items() if d == day}
+        max_all, max_group, max_user = 0.0, {}, {}
+        for t in self._tasks.values():
+            if not is_due(t, day):
+                continue
+            mx = t["points"] if t["task_type"] == "check" else t["points_per_unit"] * t["target_units"]
+            if t["group_id"] is not None:
+                max_group[t["group_id"]] = max_group.get(t["group_id"], 0.0) + mx
+            elif t["assigned_to"] is not None:
+                max_user[t["assigned_to"]] = max_user.get(t["assigned_to"], 0.0) + mx
+            else:
+                max_all += mx
+        return _rank(users, pts, max_all, max_group, max_user)
+
+    @_locked
+    def get_ids_by_uid(self, table, uids):
+        records = {"users": self._users, "tasks": self._tasks, "groups_": self._groups}.get(table)
+        if records is None or not uids:
+            return {}
+        uids = set(uids)
+        return {r["uid"]: r["id"] for r in records.values() if r["uid"] in uids}
+
+    @_locked
+    def search(self, query, limit=20):
+        # مطابقة بالبادئة على كلمات ar_index، والنقاط بأوزان bm25 في SQLiteBackend (العنوان 10 والتفاصيل 2)
+        tokens = _words(ar_norm(query))
+        if not tokens:
+            return []
+        hits = []
+        for (kind, ref), (title, detail) in self._search.items():
+            score = 0.0
+            for tok in tokens:
+                in_title = any(w.startswith(tok) for w in title)
+                in_detail = any(w.startswith(tok) for w in detail)
+                if not (in_title or in_detail):
+                    break
+                score += 10.0 * in_title + 2.0 * in_detail
+            else:
+                hits.append((score, kind, ref))
+        hits.sort(key=lambda h: -h[0])
+        results = []
+        for score, kind, ref in hits[:limit]:
+            if kind == "task":
+                title, detail = self._tasks[ref]["title"], self._tasks[ref]["unit"]
+            elif kind == "user":
+                title, detail = self._users[ref]["name"], "@" + self._users[ref]["username"]
+            else:
+                title, detail = self._groups[ref]["name"], ""
+            results.append({"kind": kind, "id": ref, "title": title, "detail": detail, "score": score})
+        return results
+
+    @_locked
+    def get_data_version(self):
+        return self._version
+
+    @_locked
+    def get_activity(self, first, last):
+        w0, w1 = (first - 1) // 7, (last - 1) // 7
+        weeks = {}
+        for (uid, day), (pts, _) in self._daily.items():
+            if w0 <= (day - 1) // 7 <= w1:
+                weeks.setdefault((uid, (day - 1) // 7), [0.0] * 7)[(day - 1) % 7] += pts
+        return {
+            "points": [(uid, w * 7 + 1, *cells) for (uid, w), cells in sorted(weeks.items())],
+            "tasks": [(tid, day, cell[1]) for (tid, day), cell in sorted(self._task_daily.items())
+                      if first <= day <= last],
+        }
+
+    # ── الجلسات ورموز واجهة JSON
+    @_locked
+    def _store_session(self, key, user_id, expires):
+        now = time.time()
+        self._sessions = {k: s for k, s in self._sessions.items() if s[1] > now}
+        self._sessions[key] = (user_id, expires)
+
+    @_locked
+    def _session_user(self, key):
+        s = self._sessions.get(key)
+        if s is None or s[1] <= time.time() or s[0] not in self._users:
+            return None
+        return dict(self._users[s[0]]), s[1]
+
+    @_locked
+    def _drop_session(self, key):
+        self._sessions.pop(key, None)
+
+    @_locked
+    def _store_api_token(self, key, user_id, label):
+        self._api_tokens[key] = (user_id, label, today())
+
+    @_locked
+    def _token_user(self, key):
+        a = self._api_tokens.get(key)
+        if a is None or a[0] not in self._users:
+            return None
+        return dict(self._users[a[0]]), None
+
+    @_locked
+    def _drop_api_tokens(self, user_id):
+        keys = [k for k, a in self._api_tokens.items() if a[0] == user_id]
+        for k in keys:
+            del self._api_tokens[k]
+        return len(keys)
+
+# ─────────────────────────────────────────────
+# اختيار الواجهة
+# ─────────────────────────────────────────────
+# PostgreSQL غير مدعوم: استعلامات SQLiteBackend بلهجة SQLite (FTS5، WITHOUT ROWID، julianday)
+BACKENDS = {"sqlite": SQLiteBackend, "memory": MemoryBackend}
+_backend = None
+_backend_key = None
+
+def backend():
+    """
+    الواجهة الحالية؛ تُبنى من جديد إن تغيّر BACKEND أو DB أو ARCHIVE_DB (manage.py --db مثلاً)،
+    وتُغلق السابقة فلا تبقى اتصالاتها مفتوحة.
+    """
+    global _backend, _backend_key
+    key = (BACKEND, DB, ARCHIVE_DB)
+    if key != _backend_key:
+        if BACKEND not in BACKENDS:
+            raise ValueError(f"unknown backend {BACKEND!r}, expected one of: {', '.join(BACKENDS)}")
+        if _backend is not None:
+            _backend.close()
+        _backend, _backend_key = BACKENDS[BACKEND](DB, ARCHIVE_DB), key
+    return _backend
+
+def get_db():
+    """اتصال خام بقاعدة SQLite الحالية داخل معاملة (للسكربتات والتشخيص؛ دوال البيانات لا تحتاجه)"""
+    b = backend()
+    if not isinstance(b, SQLiteBackend):
+        raise RuntimeError(f"get_db() needs the sqlite backend, not {BACKEND!r}")
+    return b.connect()
+
+# ─────────────────────────────────────────────
+# دوال البيانات (تفاصيلها في Backend)
+# ─────────────────────────────────────────────
+def init_db(): backend().init()
+
+def get_user(username, password): return backend().get_user(username, password)
+def get_all_users(): return backend().get_all_users()
+def add_user(name, username, password, group_id=None): return backend().add_user(name, username, password, group_id)
+def delete_user(uid): backend().delete_user(uid)
+def update_user_group(uid, group_id): backend().update_user_group(uid, group_id)
+
+def get_groups(): return backend().get_groups()
+def add_group(name): backend().add_group(name)
+def delete_group(gid): backend().delete_group(gid)
+
+def get_tasks(user_id=None, day=None): return backend().get_tasks(user_id, day)
+
+def add_task(title, assigned_to, task_type, points, unit, points_per_unit, target_units,
+             recur="daily", weekdays=127, interval_days=1, start_day=None, end_day=None, group_id=None):
+    backend().add_task(title, assigned_to, task_type, points, unit, points_per_unit, target_units,
+                       recur, weekdays, interval_days, start_day, end_day, group_id)
+
+def update_task_schedule(tid, recur="daily", weekdays=127, interval_days=1, start_day=None, end_day=None):
+    backend().update_task_schedule(tid, recur, weekdays, interval_days, start_day, end_day)
+
+def delete_task(tid): backend().delete_task(tid)
+
+def get_completions(user_id=None, day=None): return backend().get_completions(user_id, day)
+def get_daily_points(days, user_id=None): return backend().get_daily_points(days, user_id)
+def complete_check(user_id, task_id, points): backend().complete_check(user_id, task_id, points)
+def undo_task(user_id, task_id): backend().undo_task(user_id, task_id)
+def complete_numeric(user_id, task_id, units, pts): backend().complete_numeric(user_id, task_id, units, pts)
+def submit_completions(items, day=None): return backend().submit_completions(items, day)
+def import_completions(rows): return backend().import_completions(rows)
+def archive_completions(older_than_days=None, vacuum=False):
+    return backend().archive_completions(older_than_days, vacuum)
+
+def compute_user_stats(uid, user_tasks):
+    """نقاط اليوم وإنجازه؛ user_tasks مهام المستخدم المستحقة كما تُرجعها get_tasks(uid)"""
+    comps = get_completions(uid, today())
+    comp_map = {c["task_id"]: c for c in comps}
+    done = sum(1 for t in user_tasks if t["id"] in comp_map)
+    pts = sum(c["points"] for c in comps)
+    max_pts = sum(
+        t["points"] if t["task_type"] == "check" else t["points_per_unit"] * t["target_units"]
+        for t in user_tasks
+    )
+    pct = int(pts / max_pts * 100) if max_pts > 0 else 0
+    return pts, done, len(user_tasks), pct, comp_map
+
+def get_user_stats(user_id): return backend().get_user_stats(user_id)
+def rebuild_user_stats(): return backend().rebuild_user_stats()
+def get_leaderboard(day=None): return backend().get_leaderboard(day)
+def get_ids_by_uid(table, uids): return backend().get_ids_by_uid(table, uids)
+def search(query, limit=20): return backend().search(query, limit)
+def get_data_version(): return backend().get_data_version()
+def get_activity(first, last): return backend().get_activity(first, last)
+
+def create_session(user_id): return backend().create_session(user_id)
+def get_session_user(token): return backend().get_session_user(token)
+def end_session(token): backend().end_session(token)
+def create_api_token(user_id, label=""): return backend().create_api_token(user_id, label)
+def get_token_user(token): return backend().get_token_user(token)
+def revoke_api_tokens(user_id): return backend().revoke_api_tokens(user_id)
+def get_user_by_username(username): return backend().get_user_by_username(username)
+def get_user_by_uid(uid): return backend().get_user_by_uid(uid)
@@ -0,0 +1,125 @@
+"""
+اختبار حمل لواجهة JSON (api.py)
+تشغيل:
+    python manage.py seed --users 300 --tasks 40
+    python manage.py token admin            # رمز آدمن يمكنه التسجيل نيابة عن أي مستخدم
+    python api.py --port 8502 &
+    python loadtest_api.py --token <token> --procs 8 --duration 15 --batch 10
+"""
+
+import argparse
+import http.client
+import json
+import random
+import time
+from multiprocessing import Pool
+from urllib.parse import urlsplit
+
+
+def _request(conn, method, path, token, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {"Authorization": f"Bearer {token}"}
+    if data is not None:
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=data, headers=headers)
+    resp = conn.getresponse()
+    payload = resp.read()
+    return resp.status, payload
+
+
+def _connect(url):
+    u = urlsplit(url)
+    return http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+
+
+def discover(url, token, sample_users):
+    """مستخدمون ومهامهم المستحقة اليوم لبناء دفعات إنجاز واقعية"""
+    conn = _connect(url)
+    status, payload = _request(conn, "GET", "/api/leaderboard", token)
+    if status != 200:
+        raise SystemExit(f"leaderboard failed ({status}): {payload[:200]!r}")
+    users = [r["id"] for r in json.loads(payload)["leaderboard"]][:sample_users]
+    plan = []
+    for uid in users:
+        status, payload = _request(conn, "GET", f"/api/tasks?user={uid}", token)
+        for t in json.loads(payload)["tasks"]:
+            plan.append((uid, t["id"], t["task_type"], t["target_units"]))
+    conn.close()
+    if not plan:
+        raise SystemExit("no due tasks found; seed the database first (python manage.py seed)")
+    return plan
+
+
+def worker(args):
+    url, token, plan, duration, batch, read_ratio, seed = args
+    rnd = random.Random(seed)
+    conn = _connect(url)
+    lat = {"write": [], "read": []}
+    errors = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        if rnd.random() < read_ratio:
+            kind, method = "read", "GET"
+            path, body = rnd.choice(["/api/leaderboard", "/api/stats"]), None
+        else:
+            kind, method, path = "write", "POST", "/api/completions"
+            items = []
+            for uid, tid, ttype, target in rnd.sample(plan, min(batch, len(plan))):
+                item = {"user": uid, "task": tid}
+                if ttype != "check":
+                    item["units"] = float(rnd.randint(1, max(int(target), 1)))
+                items.append(item)
+            body = {"items": items}
+        t0 = time.perf_counter()
+        try:
+            status, _ = _request(conn, method, path, token, body)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = _connect(url)
+            status = 0
+        lat[kind].append(time.perf_counter() - t0)
+        errors += status != 200
+    conn.close()
+    return lat, errors
+
+
+def pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the task tracker JSON API")
+    parser.add_argument("--url", default="http://127.0.0.1:8502")
+    parser.add_argument("--token", required=True, help="admin API token (python manage.py token admin)")
+    parser.add_argument("--procs", type=int, default=8, help="client processes (one keep-alive connection each)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--batch", type=int, default=10, help="completions per POST")
+    parser.add_argument("--read-ratio", type=float, default=0.5, help="share of GET requests")
+    parser.add_argument("--sample-users", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    plan = discover(args.url, args.token, args.sample_users)
+    jobs = [(args.url, args.token, plan, args.duration, args.batch, args.read_ratio, i) for i in range(args.procs)]
+    t0 = time.perf_counter()
+    with Pool(args.procs) as pool:
+        results = pool.map(worker, jobs)
+    elapsed = time.perf_counter() - t0
+
+    lat = {"write": [], "read": []}
+    errors = 0
+    for r, e in results:
+        for k in lat:
+            lat[k].extend(r[k])
+        errors += e
+    total = sum(len(v) for v in lat.values())
+    print(f"requests: {total}  errors: {errors}  elapsed: {elapsed:.1f}s  throughput: {total / elapsed:.0f} req/s")
+    print(f"completions submitted: {len(lat['write']) * args.batch} ({len(lat['write']) * args.batch / elapsed:.0f}/s)")
+    for k, v in lat.items():
+        print(f"{k:5s}  n={len(v):7d}  p50={pct(v, 50):6.1f}ms  p95={pct(v, 95):6.1f}ms  p99={pct(v, 99):6.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+اختبار حمل لواجهة Streamlit نفسها عبر streamlit.testing.v1.AppTest (بدون متصفح)
+كل عملية تحاكي جلسات متتالية: تسجيل دخول ثم نقرات (إنجاز، تراجع، إدخال كمي، تبديل الثيم، تصفح الآدمن)
+تشغيل:
+    python manage.py --db load.db seed --users 300 --tasks 40
+    python loadtest_app.py --db load.db --procs 8 --duration 60
+"""
+
+import argparse
+import os
+import random
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# أوزان النقرات في جلسة المستخدم
+USER_MIX = {"check": 5, "undo": 2, "numeric": 3, "theme": 1, "rerun": 2}
+
+
+def _errors(at):
+    msgs = [e.message or "" for e in at.exception]
+    locked = sum("database is locked" in m for m in msgs)
+    return locked, len(msgs) - locked
+
+
+class Session:
+    def __init__(self, stats, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.stats = stats
+
+    def timed(self, action, fn):
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:  # انتهاء المهلة أو خطأ داخل AppTest نفسه
+            self.stats["errors"][action] += 1
+            self.stats["failures"].append(f"{action}: {type(e).__name__}: {e}"[:200])
+            return False
+        self.stats["latency"][action].append(time.perf_counter() - t0)
+        locked, other = _errors(self.at)
+        self.stats["locked"] += locked
+        self.stats["errors"][action] += other
+        return True
+
+    def login(self, username, password):
+        at = self.at
+        if not self.timed("open", at.run):
+            return False
+        at.text_input[0].input(username)
+        at.text_input[1].input(password)
+        submit = next(b for b in at.button if "دخول" in b.label)
+        return self.timed("login", submit.click().run) and not at.exception
+
+    def click_prefix(self, action, prefix, rnd):
+        buttons = [b for b in self.at.button if (b.key or "").startswith(prefix)]
+        if not buttons:
+            return self.timed("rerun", self.at.run)
+        return self.timed(action, rnd.choice(buttons).click().run)
+
+    def numeric(self, rnd):
+        at = self.at
+        inputs = list(at.number_input)
+        submits = [b for b in at.button if "تسجيل الإنجاز" in b.label]
+        if not inputs or len(inputs) != len(submits):
+            return self.timed("rerun", at.run)
+        i = rnd.randrange(len(inputs))
+        hi = max(int(inputs[i].max or 1), 1)
+        inputs[i].set_value(float(rnd.randint(1, hi)))
+        return self.timed("numeric", submits[i].click().run)
+
+    def user_action(self, action, rnd):
+        if action == "check":
+            return self.click_prefix("check", "chk_", rnd)
+        if action == "undo":
+            return self.click_prefix("undo", "undo_", rnd)
+        if action == "numeric":
+            return self.numeric(rnd)
+        if action == "theme":
+            return self.timed("theme", self.at.button(key="theme_toggle").click().run)
+        return self.timed("rerun", self.at.run)
+
+    def admin_action(self, rnd):
+        at = self.at
+        # تصفح الآدمن: إعادة تشغيل كاملة (كل التبويبات تُرسم في كل rerun) أو تبديل الثيم
+        if rnd.random() < 0.2:
+            return self.timed("theme", at.button(key="theme_toggle").click().run)
+        return self.timed("admin_browse", at.run)
+
+
+def worker(job):
+    db_path, duration, actions, admin_ratio, users, timeout, seed = job
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")  # تحذيرات Streamlit لكل rerun تُغرق المخرجات
+    import db
+    db.DB = db_path
+    rnd = random.Random(seed)
+    stats = {"latency": defaultdict(list), "errors": defaultdict(int), "locked": 0, "sessions": 0, "failures": []}
+    mix_names, mix_weights = list(USER_MIX), list(USER_MIX.values())
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        s = Session(stats, timeout)
+        is_admin = rnd.random() < admin_ratio
+        username, password = ("admin", "admin123") if is_admin else (f"user{rnd.randrange(users)}",) * 2
+        if not s.login(username, password):
+            continue
+        stats["sessions"] += 1
+        for _ in range(actions):
+            if time.perf_counter() >= end:
+                break
+            if is_admin:
+                s.admin_action(rnd)
+            else:
+                s.user_action(rnd.choices(mix_names, mix_weights)[0], rnd)
+    stats["latency"] = dict(stats["latency"])
+    stats["errors"] = dict(stats["errors"])
+    return stats
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless load test of the Streamlit app using AppTest")
+    parser.add_argument("--db", default="tasks.db", help="seeded database (python manage.py --db X seed)")
+    parser.add_argument("--procs", type=int, default=8, help="concurrent sessions (one process each)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--actions", type=int, default=20, help="clicks per session before a new login")
+    parser.add_argument("--admin-ratio", type=float, default=0.1, help="share of sessions that are admin")
+    parser.add_argument("--users", type=int, default=300, help="seeded users are user0..user{N-1}")
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest per-run timeout in seconds")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"{args.db} not found; seed it first: python manage.py --db {args.db} seed")
+    jobs = [(os.path.abspath(args.db), args.duration, args.actions, args.admin_ratio, args.users, args.timeout, i)
+            for i in range(args.procs)]
+    t0 = time.perf_counter()
+    with Pool(args.procs) as pool:
+        results = pool.map(worker, jobs)
+    elapsed = time.perf_counter() - t0
+
+    latency, errors = defaultdict(list), defaultdict(int)
+    locked = sessions = 0
+    failures = []
+    for r in results:
+        for k, v in r["latency"].items():
+            latency[k].extend(v)
+        for k, v in r["errors"].items():
+            errors[k] += v
+        locked += r["locked"]
+        sessions += r["sessions"]
+        failures.extend(r["failures"])
+
+    total = sum(len(v) for v in latency.values())
+    print(f"sessions: {sessions}  reruns: {total}  elapsed: {elapsed:.1f}s  throughput: {total / elapsed:.1f} reruns/s")
+    print(f"lock timeouts: {locked}  other errors: {sum(errors.values())}")
+    print(f"{'action':13s} {'n':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s}  errors")
+    for k in sorted(latency):
+        v = latency[k]
+        print(f"{k:13s} {len(v):6d} {pct(v, 50):7.0f}ms {pct(v, 95):7.0f}ms {pct(v, 99):7.0f}ms "
+              f"{max(v) * 1000:7.0f}ms  {errors.get(k, 0)}")
+    for f in failures[:10]:
+        print("  !", f)
+
+
+if __name__ == "__main__":
+    main()
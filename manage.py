@@ -0,0 +1,134 @@
+"""
+أوامر الإدارة لمنصة المهام
+تشغيل:
+    python manage.py archive --days 90 [--vacuum]
+    python manage.py token <username> [--label scanner-1]
+    python manage.py revoke <username>
+    python manage.py seed --users 300 --groups 10 --tasks 40 --days 30
+    python manage.py rebuild-stats
+"""
+
+import argparse
+import random
+
+import db
+
+
+def cmd_archive(args):
+    db.init_db()
+    rep = db.archive_completions(args.days, vacuum=args.vacuum)
+    print(f"cutoff:        {rep['cutoff']}")
+    print(f"rows moved:    {rep['rows']}")
+    print(f"months:        {', '.join(rep['months']) or '-'}")
+    print(f"archive bytes: {rep['archive_bytes']}")
+    print(f"freed bytes:   {rep['freed_bytes']}")
+
+
+def _user_id(username):
+    user = db.get_user_by_username(username)
+    if user is None:
+        raise SystemExit(f"unknown user {username!r}")
+    return user["id"]
+
+
+def cmd_token(args):
+    db.init_db()
+    print(db.create_api_token(_user_id(args.username), args.label))
+
+
+def cmd_revoke(args):
+    db.init_db()
+    print(f"revoked {db.revoke_api_tokens(_user_id(args.username))} tokens")
+
+
+def cmd_seed(args):
+    """بيانات تجريبية: مستخدمون وكلمة مرور كل منهم = اسم المستخدم، ومهام، وسجل إنجازات لأيام سابقة"""
+    db.init_db()
+    db.PW_SCRYPT_N = args.pw_cost
+    rnd = random.Random(args.seed)
+    existing = {g["name"] for g in db.get_groups()}
+    for i in range(args.groups):
+        if f"group-{i}" not in existing:
+            db.add_group(f"group-{i}")
+    gids = [g["id"] for g in db.get_groups()]
+    for i in range(args.users):
+        db.add_user(f"User {i}", f"user{i}", f"user{i}", rnd.choice(gids) if gids else None)
+    users = db.get_all_users()
+    for i in range(args.tasks):
+        kind = rnd.random()
+        if kind < 0.5:
+            assigned, gid = "all", None
+        elif kind < 0.8 and gids:
+            assigned, gid = None, rnd.choice(gids)
+        else:
+            assigned, gid = rnd.choice(users)["id"], None
+        if i % 3:
+            db.add_task(f"task-{i}", assigned, "check", rnd.choice([5, 10, 20]), "", 1.0, 1.0, group_id=gid)
+        else:
+            db.add_task(f"task-{i}", assigned, "numeric", 0, "unit", 0.5, 20.0, group_id=gid)
+
+    tasks = db.get_tasks()
+    rows, t = [], db.today()
+    for day in range(t - args.days, t):
+        for u in users:
+            for task in tasks:
+                if db.is_assigned(task, u["id"], u["group_id"]) and rnd.random() < args.rate:
+                    if task["task_type"] == "check":
+                        rows.append((u["id"], task["id"], day, 1, task["points"]))
+                    else:
+                        units = float(rnd.randint(1, int(task["target_units"])))
+                        rows.append((u["id"], task["id"], day, units, units * task["points_per_unit"]))
+    db.import_completions(rows)
+    db.rebuild_user_stats()
+    print(f"users: {len(users)}  groups: {len(gids)}  tasks: {len(tasks)}  completions: {len(rows)}")
+
+
+def cmd_rebuild_stats(args):
+    db.init_db()
+    print(f"rebuilt stats for {db.rebuild_user_stats()} users")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Task tracker admin commands")
+    parser.add_argument("--db", default=db.DB, help="path to the main database file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("archive", help="move old completions to the archive database")
+    p.add_argument("--days", type=int, default=None,
+                   help=f"archive completions older than N days (default {db.ARCHIVE_AFTER_DAYS})")
+    p.add_argument("--archive-db", default=db.ARCHIVE_DB, help="path to the archive database file")
+    p.add_argument("--vacuum", action="store_true", help="VACUUM the main database afterwards")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("token", help="create an API token for a user (printed once)")
+    p.add_argument("username")
+    p.add_argument("--label", default="")
+    p.set_defaults(func=cmd_token)
+
+    p = sub.add_parser("revoke", help="revoke all API tokens of a user")
+    p.add_argument("username")
+    p.set_defaults(func=cmd_revoke)
+
+    p = sub.add_parser("seed", help="fill the database with synthetic users, tasks and history")
+    p.add_argument("--users", type=int, default=300)
+    p.add_argument("--groups", type=int, default=10)
+    p.add_argument("--tasks", type=int, default=40)
+    p.add_argument("--days", type=int, default=30, help="days of completion history before today")
+    p.add_argument("--rate", type=float, default=0.6, help="probability a due task was completed")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--pw-cost", type=int, default=2 ** 10,
+                   help="scrypt N for seeded passwords (rehashed at full cost on first login)")
+    p.set_defaults(func=cmd_seed)
+
+    p = sub.add_parser("rebuild-stats", help="recompute streaks and lifetime totals from history")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    args = parser.parse_args(argv)
+    db.DB = args.db
+    if getattr(args, "archive_db", None):
+        db.ARCHIVE_DB = args.archive_db
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
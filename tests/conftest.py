@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+class Clock:
+    """بديل db.today: يوم ثابت يتقدم بيد الاختبار"""
+
+    def __init__(self, day):
+        self.day = day
+
+    def __call__(self):
+        return self.day
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def clock(request, tmp_path, monkeypatch):
+    """واجهة فارغة من النوعين (SQLite في ملف مؤقت) مع المستخدم admin، واليوم تحت تحكم الاختبار"""
+    monkeypatch.setattr(db, "BACKEND", request.param)
+    monkeypatch.setattr(db, "DB", str(tmp_path / "tasks.db"))
+    monkeypatch.setattr(db, "ARCHIVE_DB", str(tmp_path / "archive.db"))
+    monkeypatch.setattr(db, "PW_SCRYPT_N", 2 ** 8)
+    clock = Clock(db.today() - 30)
+    monkeypatch.setattr(db, "today", clock)
+    db.init_db()
+    yield clock
+    db.backend().close()
@@ -0,0 +1,118 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import api
+import db
+
+
+@pytest.fixture
+def users(clock):
+    """(آدمن، مستخدم في مجموعة، مستخدم آخر) كسجلات كما يُرجعها get_token_user"""
+    db.add_group("G1")
+    (gid,) = [g["id"] for g in db.get_groups()]
+    db.add_user("سارة", "sara", "pw", gid)
+    db.add_user("عمر", "omar", "pw")
+    db.add_task("check", "all", "check", 5, "", 1.0, 1.0)
+    db.add_task("walk", "all", "numeric", 0, "km", 2.0, 5.0)
+    db.add_task("group only", None, "check", 7, "", 1.0, 1.0, group_id=gid)
+    return tuple(db.get_user_by_username(name) for name in ("admin", "sara", "omar"))
+
+
+def _task_uids():
+    return {t["title"]: t["uid"] for t in db.get_tasks()}
+
+
+def _post(caller, items):
+    return api.post_completions(caller, {}, {"items": items})
+
+
+def test_post_completions_validates_items(users):
+    admin, sara, omar = users
+    tasks = _task_uids()
+    res = _post(sara, [
+        {"task": tasks["check"]},
+        {"task": "no-such-task"},
+        {"task": tasks["walk"], "units": True},
+        {"task": tasks["walk"], "units": 0},
+        {"task": tasks["walk"], "units": 5.5},
+        {"task": tasks["walk"], "units": "3"},
+        {"task": tasks["walk"], "units": 2.5},
+    ])
+    assert res["ok"] == 2
+    assert [r["status"] for r in res["results"]] == ["done", "error", "error", "error", "error", "error", "recorded"]
+    assert res["results"][1]["error"] == "unknown user or task"
+    assert all(r["error"] == "units must be in (0, 5.0]" for r in res["results"][2:6])
+    assert res["results"][6]["points"] == 5.0
+    assert db.get_user_stats(sara["id"])["lifetime_points"] == 10
+
+    # مهمة مجموعة لمستخدم خارجها
+    (err,) = _post(omar, [{"task": tasks["group only"]}])["results"]
+    assert err == {"status": "error", "error": "task not due for user", "task": tasks["group only"]}
+
+
+def test_post_completions_user_field_is_admin_only(users):
+    admin, sara, omar = users
+    tasks = _task_uids()
+    with pytest.raises(api.ApiError) as e:
+        _post(sara, [{"task": tasks["check"], "user": omar["uid"]}])
+    assert e.value.status == 403
+    assert _post(sara, [{"task": tasks["check"], "user": sara["uid"]}])["ok"] == 1
+
+    res = _post(admin, [{"task": tasks["check"], "user": omar["uid"]}, {"task": tasks["check"], "user": "nobody"}])
+    assert [r["status"] for r in res["results"]] == ["done", "error"]
+    assert db.get_user_stats(omar["id"])["lifetime_points"] == 5
+
+    with pytest.raises(api.ApiError) as e:
+        _post(admin, [{"task": tasks["check"], "user": 5}])
+    assert e.value.status == 400
+
+
+@pytest.mark.parametrize("body", [{}, {"items": []}, {"items": "x"}, [], {"items": [{"units": 1}]}])
+def test_post_completions_rejects_malformed_body(users, body):
+    with pytest.raises(api.ApiError) as e:
+        api.post_completions(users[1], {}, body)
+    assert e.value.status == 400
+
+
+def test_post_completions_batch_limit(users, monkeypatch):
+    sara, task = users[1], _task_uids()["check"]
+    monkeypatch.setattr(api, "MAX_BATCH", 3)
+    assert _post(sara, [{"task": task}] * 3)["ok"] == 3
+    with pytest.raises(api.ApiError) as e:
+        _post(sara, [{"task": task}] * 4)
+    assert e.value.status == 413
+
+
+def test_stats_use_target_users_group(users):
+    admin, sara, omar = users
+    tasks = _task_uids()
+    _post(sara, [{"task": tasks["group only"]}])
+    assert api.get_stats(sara, {}, {}) | {"day": None} == {
+        "day": None, "points": 7, "done": 1, "total": 3, "pct": 7 * 100 // 22}
+    assert api.get_stats(admin, {"user": sara["uid"]}, {}) == api.get_stats(sara, {}, {})
+    assert api.get_stats(admin, {"user": omar["uid"]}, {})["total"] == 2
+    with pytest.raises(api.ApiError) as e:
+        api.get_stats(omar, {"user": sara["uid"]}, {})
+    assert e.value.status == 403
+
+
+def test_bad_content_length_gets_400(users):
+    token = db.create_api_token(users[1]["id"])
+    server = api.make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for length in ("abc", "-1"):
+            conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+            conn.putrequest("POST", "/api/completions")
+            conn.putheader("Authorization", f"Bearer {token}")
+            conn.putheader("Content-Length", length)
+            conn.endheaders()
+            resp = conn.getresponse()
+            assert (resp.status, json.loads(resp.read())) == (400, {"error": "invalid Content-Length"})
+            conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+import db
+
+
+def _history(clock, days=40):
+    """إنجازات عشوائية لثلاثة مستخدمين على مدى days يوماً، واليوم في نهايتها"""
+    for name in ("a", "b", "c"):
+        db.add_user(name, name, "pw")
+    db.add_task("check", "all", "check", 5, "", 1.0, 1.0)
+    db.add_task("numeric", "all", "numeric", 0, "km", 0.5, 10.0)
+    users = [u["id"] for u in db.get_all_users()]
+    tasks = {t["title"]: t["id"] for t in db.get_tasks()}
+    rnd = random.Random(3)
+    first = clock.day
+    for _ in range(days):
+        for uid in users:
+            if rnd.random() < 0.7:
+                db.complete_check(uid, tasks["check"], 5)
+            if rnd.random() < 0.5:
+                db.complete_numeric(uid, tasks["numeric"], rnd.randint(1, 10), 0.5 * rnd.randint(1, 10))
+        clock.day += 1
+    return users, first
+
+
+def _snapshot(users, first, last):
+    days = list(range(first, last + 1))
+    return (db.get_daily_points(days), {uid: db.get_daily_points(days, uid) for uid in users},
+            {uid: db.get_user_stats(uid) for uid in users}, db.get_activity(first, last))
+
+
+def test_archiving_keeps_summaries_and_stats(clock):
+    users, first = _history(clock)
+    before = _snapshot(users, first, clock.day)
+    live = len(db.get_completions())
+
+    report = db.archive_completions(older_than_days=10)
+    assert report["cutoff"] == db.day_iso(clock.day - 10)
+    assert report["rows"] == live - len(db.get_completions()) > 0
+    assert all(c["day"] >= clock.day - 10 for c in db.get_completions())
+    assert _snapshot(users, first, clock.day) == before
+
+    again = db.archive_completions(older_than_days=10)
+    assert (again["rows"], again["months"]) == (0, [])
+    assert _snapshot(users, first, clock.day) == before
+
+    # الإحصاءات المعاد بناؤها من الملخص تشمل الأيام المؤرشفة
+    db.rebuild_user_stats()
+    assert _snapshot(users, first, clock.day) == before
+
+
+def test_archive_rejects_zero_days(clock):
+    with pytest.raises(ValueError):
+        db.archive_completions(older_than_days=0)
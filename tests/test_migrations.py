@@ -0,0 +1,147 @@
+import hashlib
+import sqlite3
+from datetime import date
+
+import pytest
+
+import db
+
+# مخطط app.py قبل فصل طبقة البيانات (المخطط 1)
+V1_SCHEMA = """
+CREATE TABLE users (
+    id TEXT PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    role TEXT DEFAULT 'user',
+    group_id TEXT
+);
+CREATE TABLE groups_ (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE tasks (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    assigned_to TEXT NOT NULL,
+    task_type TEXT DEFAULT 'check',
+    points INTEGER DEFAULT 10,
+    unit TEXT DEFAULT '',
+    points_per_unit REAL DEFAULT 1.0,
+    target_units REAL DEFAULT 1.0,
+    created_at TEXT
+);
+CREATE TABLE completions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    date_ TEXT NOT NULL,
+    units REAL DEFAULT 1.0,
+    points REAL DEFAULT 0.0,
+    UNIQUE(user_id, task_id, date_)
+);
+"""
+
+
+def _sha(pw):
+    return hashlib.sha256(pw.encode()).hexdigest()
+
+
+@pytest.fixture
+def v1_db(tmp_path, monkeypatch):
+    """قاعدة بالمخطط 1: مستخدمان ومجموعة ومهمتان وإنجازات ثلاثة أيام"""
+    monkeypatch.setattr(db, "BACKEND", "sqlite")
+    monkeypatch.setattr(db, "DB", str(tmp_path / "tasks.db"))
+    monkeypatch.setattr(db, "ARCHIVE_DB", str(tmp_path / "archive.db"))
+    monkeypatch.setattr(db, "PW_SCRYPT_N", 2 ** 8)
+    t = db.today()
+    iso = lambda n: date.fromordinal(n).isoformat()  # noqa: E731
+    conn = sqlite3.connect(db.DB)
+    conn.executescript(V1_SCHEMA)
+    conn.executemany("INSERT INTO users VALUES (?,?,?,?,?,?)", [
+        ("a1", "admin", _sha("admin123"), "المدير", "admin", None),
+        ("u1", "sara", _sha("pw"), "سارة", "user", "g1"),
+        ("u2", "omar", _sha("pw"), "عمر", "user", None),
+    ])
+    conn.execute("INSERT INTO groups_ VALUES ('g1', 'فريق التطوير')")
+    conn.executemany("INSERT INTO tasks VALUES (?,?,?,?,?,?,?,?,?)", [
+        ("t1", "قراءة القرآن", "all", "check", 10, "", 1.0, 1.0, iso(t - 5)),
+        ("t2", "المشي", "u2", "numeric", 0, "كم", 2.0, 5.0, iso(t - 5)),
+        ("t3", "مهمة يتيمة", "gone", "check", 10, "", 1.0, 1.0, iso(t - 5)),
+    ])
+    conn.executemany("INSERT INTO completions VALUES (?,?,?,?,?,?)", [
+        ("c1", "u1", "t1", iso(t - 2), 1, 10),
+        ("c2", "u1", "t1", iso(t - 1), 1, 10),
+        ("c3", "u1", "t1", iso(t), 1, 10),
+        ("c4", "u2", "t2", iso(t - 1), 3, 6),
+        ("c5", "gone", "t1", iso(t), 1, 10),
+    ])
+    conn.commit()
+    conn.close()
+    yield t
+    db.backend().close()
+
+
+def test_v1_migrates_to_current_schema(v1_db):
+    t = v1_db
+    db.init_db()
+    with db.get_db() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '\\_v1\\_%' ESCAPE '\\'").fetchall()
+
+    users = {u["username"]: u for u in db.get_all_users()}
+    assert set(users) == {"sara", "omar"}
+    (group,) = db.get_groups()
+    assert users["sara"]["group_id"] == group["id"] and users["omar"]["group_id"] is None
+    tasks = {task["uid"]: task for task in db.get_tasks()}
+    assert set(tasks) == {"t1", "t2"}  # t3 كانت لمستخدم محذوف
+    assert tasks["t2"]["assigned_to"] == users["omar"]["id"]
+    assert tasks["t1"]["start_day"] == t - 5 and tasks["t1"]["recur"] == "daily"
+
+    sara, omar = users["sara"]["id"], users["omar"]["id"]
+    assert db.get_daily_points([t - 2, t - 1, t]) == {t - 2: 10, t - 1: 16, t: 10}
+    assert db.get_user_stats(sara)["current_streak"] == 3
+    assert db.get_user_stats(omar)["lifetime_points"] == 6
+    assert {(r[0], r[1]) for r in db.get_activity(t - 2, t)["tasks"]} == {
+        (tasks["t1"]["id"], t - 2), (tasks["t1"]["id"], t - 1), (tasks["t1"]["id"], t), (tasks["t2"]["id"], t - 1)}
+    assert [r["title"] for r in db.search("قران")] == ["قراءة القرآن"]
+    assert [r["kind"] for r in db.search("تطو")] == ["group"]
+
+    # كلمة المرور القديمة ما زالت تعمل، والمهام المستحقة من فهرس task_due
+    assert db.get_user("sara", "pw")["id"] == sara
+    assert {task["uid"] for task in db.get_tasks(omar)} == {"t1", "t2"}
+
+    db.init_db()  # مرة ثانية لا تغيّر شيئاً
+    assert db.get_daily_points([t - 1]) == {t - 1: 16}
+
+
+def test_v1_with_archive_migrates(v1_db):
+    """daily_summary وجداول الأرشيف بعمود date_ من أول نسخة لأرشفة الإنجازات"""
+    t = v1_db
+    old = t - 200
+    month = date.fromordinal(old).strftime("%Y_%m")
+    conn = sqlite3.connect(db.DB)
+    conn.executescript(f"""
+    CREATE TABLE daily_summary (user_id TEXT NOT NULL, date_ TEXT NOT NULL, points REAL DEFAULT 0.0,
+                                done INTEGER DEFAULT 0, PRIMARY KEY (user_id, date_));
+    CREATE INDEX idx_daily_summary_date ON daily_summary(date_);
+    CREATE INDEX idx_completions_date ON completions(date_);
+    INSERT INTO daily_summary VALUES ('u1', '{date.fromordinal(old).isoformat()}', 10, 1);
+    """)
+    conn.close()
+    conn = sqlite3.connect(db.ARCHIVE_DB)
+    conn.execute(f"CREATE TABLE completions_{month} (id TEXT, user_id TEXT, task_id TEXT, date_ TEXT,"
+                 " units REAL, points REAL)")
+    conn.execute(f"INSERT INTO completions_{month} VALUES ('c0', 'u1', 't1', ?, 1, 10)",
+                 (date.fromordinal(old).isoformat(),))
+    conn.commit()
+    conn.close()
+
+    db.init_db()
+    sara = db.get_ids_by_uid("users", ["u1"])["u1"]
+    t1 = db.get_ids_by_uid("tasks", ["t1"])["t1"]
+    assert db.get_daily_points([old], sara) == {old: 10}
+    assert db.get_user_stats(sara)["lifetime_points"] == 40
+    assert (t1, old, 1) in db.get_activity(old, old)["tasks"]
+    with sqlite3.connect(db.ARCHIVE_DB) as conn:
+        assert conn.execute(f"SELECT user_id, task_id, day FROM completions_{month}").fetchall() == [(sara, t1, old)]
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("قراءةُ القُرْآنِ", "قراءه القران"),
+    ("أحمد وإسلام وآمنة", "احمد واسلام وامنه"),
+    ("مستشفى مؤسسة شاطئ", "مستشفي موسسه شاطي"),
+    ("تطـــوير ١٢٣", "تطوير 123"),
+    ("Run ٥ KM", "run 5 km"),
+    ("", ""),
+])
+def test_ar_norm(text, expected):
+    assert db.ar_norm(text) == expected
+
+
+def test_ar_index_adds_words_without_article():
+    assert db.ar_index("فريق التطوير والتسويق") == "فريق التطوير والتسويق تطوير تسويق"
+    assert db.ar_index("الم") == "الم"  # كلمة قصيرة لا تُجرَّد
+
+
+def _titles(query):
+    return sorted(r["title"] for r in db.search(query))
+
+
+def test_prefix_search_with_normalization(clock):
+    db.add_task("قراءة القرآن", "all", "check", 5, "", 1.0, 1.0)
+    db.add_task("المشي السريع", "all", "numeric", 0, "كيلومتر", 1.0, 5.0)
+    db.add_group("فريق التطوير")
+    db.add_user("أحمد علي", "ahmad", "pw")
+
+    assert _titles("تطو") == ["فريق التطوير"]
+    assert _titles("التطو") == ["فريق التطوير"]
+    assert _titles("قراءه") == ["قراءة القرآن"]
+    assert _titles("قران") == ["قراءة القرآن"]
+    assert _titles("احمد") == ["أحمد علي"]
+    assert _titles("ahm") == ["أحمد علي"]
+    assert _titles("مشي كيلو") == ["المشي السريع"]  # كل الكلمات مطلوبة، والوحدة في التفاصيل
+    assert _titles("مشي تطو") == []
+    assert _titles('"') == [] and _titles("  ") == []
+
+    (hit,) = db.search("تطو")
+    assert (hit["kind"], hit["detail"]) == ("group", "")
+    (hit,) = db.search("ahmad")
+    assert (hit["kind"], hit["detail"]) == ("user", "@ahmad")
+
+
+def test_title_outranks_detail(clock):
+    db.add_task("المشي", "all", "numeric", 0, "خطوات", 1.0, 5.0)
+    db.add_task("خطوات الصباح", "all", "check", 5, "", 1.0, 1.0)
+    assert [r["title"] for r in db.search("خطو")] == ["خطوات الصباح", "المشي"]
+
+
+def test_index_follows_deletes(clock):
+    db.add_task("قراءة", "all", "check", 5, "", 1.0, 1.0)
+    db.add_group("القراء")
+    (task,) = db.get_tasks()
+    db.delete_task(task["id"])
+    assert _titles("قرا") == ["القراء"]
+
+
+def test_external_writes_keep_index_consistent(clock):
+    """المشغلات SQL عادي: الكتابة من اتصال خارجي (sqlite3 أو سكربت نسخ احتياطي) تعمل"""
+    if db.BACKEND != "sqlite":
+        pytest.skip("sqlite only")
+    db.add_task("قراءة", "all", "check", 5, "", 1.0, 1.0)
+    with sqlite3.connect(db.DB) as conn:
+        conn.execute("UPDATE tasks SET title='تلاوة', search_title='تلاوه'")
+        conn.execute("INSERT INTO groups_ (uid, name, search_title) VALUES ('x', 'المراجعة', 'المراجعه مراجعه')")
+    conn.close()
+    assert _titles("تلا") == ["تلاوة"]
+    assert _titles("قرا") == []
+    assert _titles("مراج") == ["المراجعة"]
+    with sqlite3.connect(db.DB) as conn:
+        conn.execute("DELETE FROM tasks")
+    conn.close()
+    assert _titles("تلا") == []
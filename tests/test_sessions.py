@@ -0,0 +1,57 @@
+import hashlib
+
+import db
+
+
+def _sara():
+    db.add_user("سارة", "sara", "pw")
+    return db.get_user_by_username("sara")["id"]
+
+
+def test_legacy_sha256_hash_is_upgraded_on_login(clock):
+    uid = _sara()
+    db.backend()._set_password_hash(uid, hashlib.sha256(b"pw").hexdigest())
+
+    assert db.get_user("sara", "wrong") is None
+    assert not db.get_user_by_username("sara")["password_hash"].startswith("scrypt$")
+
+    assert db.get_user("sara", "pw")["id"] == uid
+    upgraded = db.get_user_by_username("sara")["password_hash"]
+    assert upgraded.startswith(f"scrypt${db.PW_SCRYPT_N}$")
+    assert db.get_user("sara", "pw")["id"] == uid
+    assert db.get_user_by_username("sara")["password_hash"] == upgraded  # لا إعادة تجزئة بلا داعٍ
+
+
+def test_scrypt_cost_change_rehashes_on_login(clock, monkeypatch):
+    _sara()
+    monkeypatch.setattr(db, "PW_SCRYPT_N", 2 ** 9)
+    assert db.get_user("sara", "pw") is not None
+    assert db.get_user_by_username("sara")["password_hash"].startswith("scrypt$512$")
+
+
+def test_session_cache_follows_group_change_and_delete(clock):
+    uid = _sara()
+    db.add_group("G1")
+    (gid,) = [g["id"] for g in db.get_groups()]
+    db.add_task("group task", None, "check", 5, "", 1.0, 1.0, group_id=gid)
+    session, token = db.create_session(uid), db.create_api_token(uid)
+    assert db.get_session_user(session)["group_id"] is None
+    assert db.get_token_user(token)["group_id"] is None
+
+    db.update_user_group(uid, gid)
+    assert db.get_session_user(session)["group_id"] == gid
+    assert db.get_token_user(token)["group_id"] == gid
+    assert db.compute_user_stats(uid, db.get_tasks(uid))[2] == 1
+
+    db.delete_user(uid)
+    assert db.get_session_user(session) is None
+    assert db.get_token_user(token) is None
+
+
+def test_end_session(clock):
+    uid = _sara()
+    session = db.create_session(uid)
+    assert db.get_session_user(session)["id"] == uid
+    db.end_session(session)
+    assert db.get_session_user(session) is None
+    assert db.get_session_user("") is None
@@ -0,0 +1,104 @@
+import random
+
+import db
+
+
+def _setup(n_users=1):
+    for i in range(n_users):
+        db.add_user(f"user {i}", f"u{i}", "pw")
+    db.add_task("check", "all", "check", 5, "", 1.0, 1.0)
+    db.add_task("numeric", "all", "numeric", 0, "km", 0.5, 10.0)
+    users = [u["id"] for u in db.get_all_users()]
+    tasks = {t["title"]: t["id"] for t in db.get_tasks()}
+    return users, tasks
+
+
+def _all_stats(users):
+    return {uid: db.get_user_stats(uid) for uid in users}
+
+
+def test_streak_folds_across_days(clock):
+    (uid,), tasks = _setup()
+    start = clock.day
+    for expected in (1, 2, 3):
+        db.complete_check(uid, tasks["check"], 5)
+        assert db.get_user_stats(uid)["current_streak"] == expected
+        clock.day += 1
+
+    # يوم بلا إنجاز حتى الآن: سلسلة الأمس ما زالت حية
+    st = db.get_user_stats(uid)
+    assert (st["current_streak"], st["longest_streak"], st["lifetime_points"]) == (3, 3, 15)
+
+    clock.day += 1
+    db.complete_numeric(uid, tasks["numeric"], 8, 4.0)
+    db.complete_check(uid, tasks["check"], 5)
+    st = db.get_user_stats(uid)
+    assert st == {"current_streak": 1, "longest_streak": 3, "lifetime_points": 24,
+                  "best_day_points": 9, "best_day": start + 4}
+
+    clock.day += 2
+    assert db.get_user_stats(uid)["current_streak"] == 0
+
+
+def test_undo_reopens_only_today(clock):
+    (uid,), tasks = _setup()
+    db.complete_check(uid, tasks["check"], 5)
+    clock.day += 1
+    db.complete_check(uid, tasks["check"], 5)
+    assert db.get_user_stats(uid)["current_streak"] == 2
+
+    db.undo_task(uid, tasks["check"])
+    st = db.get_user_stats(uid)
+    assert (st["current_streak"], st["longest_streak"], st["lifetime_points"]) == (1, 1, 5)
+
+    db.undo_task(uid, tasks["check"])  # لا شيء للتراجع عنه
+    db.complete_check(uid, tasks["check"], 5)
+    db.complete_check(uid, tasks["check"], 5)  # مسجلة من قبل
+    st = db.get_user_stats(uid)
+    assert (st["current_streak"], st["lifetime_points"]) == (2, 10)
+
+
+def test_incremental_stats_match_rebuild(clock):
+    users, tasks = _setup(n_users=4)
+    rnd = random.Random(7)
+    for _ in range(25):
+        for _ in range(rnd.randint(0, 8)):
+            uid, op = rnd.choice(users), rnd.random()
+            if op < 0.4:
+                db.complete_check(uid, tasks["check"], 5)
+            elif op < 0.7:
+                db.complete_numeric(uid, tasks["numeric"], rnd.randint(1, 10), 0.5 * rnd.randint(1, 10))
+            elif op < 0.85:
+                db.undo_task(uid, rnd.choice(list(tasks.values())))
+            else:
+                db.submit_completions([{"user_id": uid, "task_id": tasks["numeric"], "units": rnd.randint(1, 10)}])
+        clock.day += rnd.choice([1, 1, 1, 2])
+
+    incremental = _all_stats(users)
+    assert db.rebuild_user_stats() == len(users) + 1  # مع admin
+    assert _all_stats(users) == incremental
+    assert any(st["longest_streak"] > 1 for st in incremental.values())
+
+
+def test_delete_task_rebuilds_affected_users(clock):
+    (a, b), tasks = _setup(n_users=2)
+    start = clock.day
+    for _ in range(3):
+        db.complete_check(a, tasks["check"], 5)
+        db.complete_check(b, tasks["check"], 5)
+        clock.day += 1
+    db.complete_numeric(a, tasks["numeric"], 4, 2.0)
+    db.complete_check(a, tasks["check"], 5)
+
+    db.delete_task(tasks["check"])
+
+    after = _all_stats([a, b])
+    assert after[a] == {"current_streak": 1, "longest_streak": 1, "lifetime_points": 2,
+                        "best_day_points": 2, "best_day": start + 3}
+    assert after[b] == {"current_streak": 0, "longest_streak": 0, "lifetime_points": 0,
+                        "best_day_points": 0, "best_day": None}
+    db.rebuild_user_stats()
+    assert _all_stats([a, b]) == after
+    assert db.get_completions() == [
+        {"user_id": a, "task_id": tasks["numeric"], "day": start + 3, "units": 4.0, "points": 2.0}
+    ]
@@ -0,0 +1,51 @@
+import db
+
+
+def _titles(tasks):
+    return sorted(t["title"] for t in tasks)
+
+
+def test_deleted_ids_are_not_reused(clock):
+    db.add_user("علي", "ali", "pw")
+    db.add_group("G1")
+    (ali,) = [u["id"] for u in db.get_all_users()]
+    (g1,) = [g["id"] for g in db.get_groups()]
+    db.add_task("ali private", ali, "check", 5, "", 1.0, 1.0)
+    db.add_task("group task", None, "check", 5, "", 1.0, 1.0, group_id=g1)
+    db.delete_user(ali)
+    db.delete_group(g1)
+
+    db.add_user("بكر", "bob", "pw")
+    db.add_group("G2")
+    (bob,) = [u["id"] for u in db.get_all_users()]
+    (g2,) = [g["id"] for g in db.get_groups()]
+    db.update_user_group(bob, g2)
+    assert bob != ali and g2 != g1
+    assert _titles(db.get_tasks(bob)) == []
+
+
+def test_delete_group_deletes_its_tasks(clock):
+    db.add_user("سارة", "sara", "pw")
+    db.add_group("G1")
+    (sara,) = [u["id"] for u in db.get_all_users()]
+    (g1,) = [g["id"] for g in db.get_groups()]
+    db.update_user_group(sara, g1)
+    db.add_task("group task", None, "check", 5, "", 1.0, 1.0, group_id=g1)
+    db.add_task("shared", "all", "check", 3, "", 1.0, 1.0)
+    tasks = {t["title"]: t["id"] for t in db.get_tasks()}
+    for _ in range(3):
+        db.complete_check(sara, tasks["group task"], 5)
+        db.complete_check(sara, tasks["shared"], 3)
+        clock.day += 1
+
+    db.delete_group(g1)
+    assert _titles(db.get_tasks()) == ["shared"]
+    assert _titles(db.get_tasks(day=clock.day)) == ["shared"]
+    assert db.get_all_users()[0]["group_id"] is None
+    assert db.get_user_stats(sara)["lifetime_points"] == 9
+    assert {r[0] for r in db.get_activity(clock.day - 3, clock.day)["tasks"]} == {tasks["shared"]}
+    assert db.search("group") == []
+    if db.BACKEND == "sqlite":
+        with db.get_db() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM task_due WHERE task_id=?",
+                                (tasks["group task"],)).fetchone()[0] == 0